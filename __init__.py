@@ -3,33 +3,63 @@ from flask_sqlalchemy import SQLAlchemy
 from os import path
 from flask_login import LoginManager
 
-db = SQLAlchemy()
+import database
+
+db = SQLAlchemy(session_options={'class_': database.RoutingSession})
 DB_NAME = "spendly.db"
 
 
-def create_app():
+def create_app(config=None):
     app = Flask(__name__)
     app.config['SECRET_KEY'] = 'ayisgdysiasgdasikasjdhaskydgk'
     app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{DB_NAME}'
+    app.config.update(database.config_from_env())
+    if config:
+        app.config.update(config)
+
+    database.configure(app)
     db.init_app(app)
+    database.init_app(app)
+
+    from chart_cache import chart_cache
+    chart_cache.init_app(app)
+
+    from render_pool import render_pool
+    render_pool.init_app(app)
+
+    from jobs import job_queue
+    job_queue.init_app(app)
+
+    import instrumentation
+    instrumentation.init_app(app)
 
     from views import views
     from auth import auth
+    from exports import exports
+    from imports import imports
 
     app.register_blueprint(views, url_prefix='/')
     app.register_blueprint(auth, url_prefix='/')
+    app.register_blueprint(exports, url_prefix='/')
+    app.register_blueprint(imports, url_prefix='/')
 
-    from models import User, Note, Expense, Account
+    from models import User
+    import migrate
     with app.app_context():
-        db.create_all()
+        # Only the primary; a replica gets its schema through replication.
+        migrate.upgrade_on_start(app, db.engine)
 
     login_manager = LoginManager()
     login_manager.login_view = 'auth.login'
     login_manager.init_app(app)
 
+    from user_cache import user_cache, register_invalidation
+    user_cache.init_app(app)
+    register_invalidation()
+
     @login_manager.user_loader
     def load_user(id):
-        return User.query.get(int(id))
+        return user_cache.load(int(id))
 
     return app
 
@@ -2,13 +2,14 @@
 
 import io
 import base64
+import threading
 from datetime import datetime, timedelta
 
 import numpy as np
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
 
+from instrumentation import timed
 
 
 def _chart_style(fig, ax):
@@ -25,29 +26,81 @@ def _chart_style(fig, ax):
     ax.grid(True, color='#1e293b', linewidth=0.5, alpha=0.6)
 
 
+# Figures are reused across renders instead of being built and torn down per
+# image. The pool is shared by all threads (the threaded server starts one per
+# request): a render takes a free Figure of its size and _to_png hands it back.
+# Only the Figure and canvas are kept; fig.clear() drops the styling along
+# with the previous chart, so it is applied again on every render.
+FIGURE_POOL_SIZE = 4
+_free_figures = {}
+_figures_lock = threading.Lock()
+
+
+def _figure(figsize, styled=True):
+    """Return a cleared (fig, ax) of the given size from the shared pool.
+
+    Uses the object-oriented Figure/FigureCanvasAgg API so nothing touches
+    pyplot's global figure registry. Pass the figure to _to_png, which
+    returns it to the pool; one dropped by an error is simply not reused.
+    """
+    with _figures_lock:
+        free = _free_figures.get(figsize)
+        fig = free.pop() if free else None
+    if fig is None:
+        fig = Figure(figsize=figsize, facecolor='#0f172a')
+        FigureCanvasAgg(fig)
+        fig.pool_key = figsize
+    else:
+        fig.clear()
+    ax = fig.add_subplot()
+    if styled:
+        _chart_style(fig, ax)
+    else:
+        ax.set_facecolor('#0f172a')
+    return fig, ax
+
+
+def _release(fig):
+    with _figures_lock:
+        free = _free_figures.setdefault(fig.pool_key, [])
+        if len(free) < FIGURE_POOL_SIZE:
+            free.append(fig)
+
+
+def _to_png(fig):
+    """Lay out the figure, return it as PNG bytes and put the figure back in the pool."""
+    try:
+        buf = io.BytesIO()
+        fig.tight_layout()
+        fig.savefig(buf, format='png', facecolor='#0f172a', edgecolor='none', dpi=120)
+        return buf.getvalue()
+    finally:
+        _release(fig)
+
+
+def _rotate_xticklabels(ax):
+    ax.tick_params(axis='x', labelrotation=25, labelsize=9)
+    for label in ax.get_xticklabels():
+        label.set_horizontalalignment('right')
+
+
 def _to_b64(buf_bytes):
     """Return base64 string from raw PNG bytes."""
     return base64.b64encode(buf_bytes).decode('utf-8')
 
 
+@timed
 def get_expense_category_totals(user_id):
     """Return dict {category: total} for expenses."""
-    from models import Expense
-    expenses = Expense.query.filter_by(user_id=user_id, type='Expense').all()
-    totals = {}
-    for e in expenses:
-        totals[e.category] = totals.get(e.category, 0) + e.amount
-    return totals
+    import rollups
+    return rollups.category_totals(user_id, 'Expense')
 
 
+@timed
 def get_income_category_totals(user_id):
     """Return dict {category: total} for income."""
-    from models import Expense
-    incomes = Expense.query.filter_by(user_id=user_id, type='Income').all()
-    totals = {}
-    for e in incomes:
-        totals[e.category] = totals.get(e.category, 0) + e.amount
-    return totals
+    import rollups
+    return rollups.category_totals(user_id, 'Income')
 
 
 # ── Gradient colour palettes ──
@@ -57,13 +110,12 @@ _INCOME_COLORS  = ['#34d399', '#2dd4bf', '#22d3ee', '#38bdf8', '#60a5fa',
                    '#818cf8', '#a78bfa', '#c084fc', '#e879f9', '#f472b6']
 
 
+@timed
 def render_pie_chart(category_totals, title='Expenses by Category', colors=None):
     """Render a styled pie chart and return PNG bytes."""
     if colors is None:
         colors = _EXPENSE_COLORS
-    buf = io.BytesIO()
-    fig, ax = plt.subplots(figsize=(7, 7), facecolor='#0f172a')
-    ax.set_facecolor('#0f172a')
+    fig, ax = _figure((7, 7), styled=False)
 
     if category_totals:
         n = len(category_totals)
@@ -88,18 +140,13 @@ def render_pie_chart(category_totals, title='Expenses by Category', colors=None)
                 transform=ax.transAxes)
         ax.set_axis_off()
 
-    plt.tight_layout()
-    plt.savefig(buf, format='png', facecolor='#0f172a', edgecolor='none', dpi=120)
-    plt.close(fig)
-    buf.seek(0)
-    return buf.getvalue()
+    return _to_png(fig)
 
 
+@timed
 def render_bar_chart(category_totals, title='Expenses by Category', color='#818cf8'):
     """Render a styled bar chart and return PNG bytes."""
-    buf = io.BytesIO()
-    fig, ax = plt.subplots(figsize=(9, 5), facecolor='#0f172a')
-    _chart_style(fig, ax)
+    fig, ax = _figure((9, 5))
 
     if category_totals:
         cats = list(category_totals.keys())
@@ -113,24 +160,19 @@ def render_bar_chart(category_totals, title='Expenses by Category', color='#818c
                     color='#e2e8f0', fontsize=9, fontweight='bold')
         ax.set_ylabel('Amount (₹)', fontsize=11)
         ax.set_title(title, fontsize=14, fontweight='bold', pad=12)
-        plt.xticks(rotation=25, ha='right', fontsize=9)
+        _rotate_xticklabels(ax)
     else:
         ax.text(0.5, 0.5, 'No data yet.', ha='center', va='center',
                 fontsize=13, color='#94a3b8', transform=ax.transAxes)
         ax.set_axis_off()
 
-    plt.tight_layout()
-    plt.savefig(buf, format='png', facecolor='#0f172a', edgecolor='none', dpi=120)
-    plt.close(fig)
-    buf.seek(0)
-    return buf.getvalue()
+    return _to_png(fig)
 
 
+@timed
 def render_line_chart(category_totals, title='Expenses by Category', color='#818cf8'):
     """Render a styled line chart and return PNG bytes."""
-    buf = io.BytesIO()
-    fig, ax = plt.subplots(figsize=(9, 5), facecolor='#0f172a')
-    _chart_style(fig, ax)
+    fig, ax = _figure((9, 5))
 
     if category_totals:
         cats = list(category_totals.keys())
@@ -141,24 +183,19 @@ def render_line_chart(category_totals, title='Expenses by Category', color='#818
         ax.fill_between(range(len(cats)), vals, alpha=0.15, color=color)
         ax.set_ylabel('Amount (₹)', fontsize=11)
         ax.set_title(title, fontsize=14, fontweight='bold', pad=12)
-        plt.xticks(rotation=25, ha='right', fontsize=9)
+        _rotate_xticklabels(ax)
     else:
         ax.text(0.5, 0.5, 'No data yet.', ha='center', va='center',
                 fontsize=13, color='#94a3b8', transform=ax.transAxes)
         ax.set_axis_off()
 
-    plt.tight_layout()
-    plt.savefig(buf, format='png', facecolor='#0f172a', edgecolor='none', dpi=120)
-    plt.close(fig)
-    buf.seek(0)
-    return buf.getvalue()
+    return _to_png(fig)
 
 
+@timed
 def render_merged_bar_chart(expense_totals, income_totals, title='Expense vs Income by Category'):
     """Render a merged bar chart comparing expenses (red) and income (green)."""
-    buf = io.BytesIO()
-    fig, ax = plt.subplots(figsize=(10, 6), facecolor='#0f172a')
-    _chart_style(fig, ax)
+    fig, ax = _figure((10, 6))
 
     # Get all unique categories from both
     all_categories = set(list(expense_totals.keys()) + list(income_totals.keys()))
@@ -200,18 +237,13 @@ def render_merged_bar_chart(expense_totals, income_totals, title='Expense vs Inc
                 fontsize=13, color='#94a3b8', transform=ax.transAxes)
         ax.set_axis_off()
 
-    plt.tight_layout()
-    plt.savefig(buf, format='png', facecolor='#0f172a', edgecolor='none', dpi=120)
-    plt.close(fig)
-    buf.seek(0)
-    return buf.getvalue()
+    return _to_png(fig)
 
 
+@timed
 def render_merged_line_chart(expense_totals, income_totals, title='Expense vs Income Trend'):
     """Render a merged line chart comparing expenses (red) and income (blue)."""
-    buf = io.BytesIO()
-    fig, ax = plt.subplots(figsize=(11, 6), facecolor='#0f172a')
-    _chart_style(fig, ax)
+    fig, ax = _figure((11, 6))
 
     # Get all unique categories from both
     all_categories = set(list(expense_totals.keys()) + list(income_totals.keys()))
@@ -246,161 +278,261 @@ def render_merged_line_chart(expense_totals, income_totals, title='Expense vs In
                 fontsize=13, color='#94a3b8', transform=ax.transAxes)
         ax.set_axis_off()
 
-    plt.tight_layout()
-    plt.savefig(buf, format='png', facecolor='#0f172a', edgecolor='none', dpi=120)
-    plt.close(fig)
-    buf.seek(0)
-    return buf.getvalue()
-
-
-#  AI Model 1 : Linear Regression Forecast (numpy.polyfit  –  degree 1)
-
-def _get_daily_spending(user_id, days=60):
-    """Fetch daily expense totals directly from spendly.db and return dense day series."""
-    from models import Expense
-    from sqlalchemy import func
-
-    cutoff = datetime.now() - timedelta(days=days)
-    rows = (Expense.query
-            .with_entities(
-                func.date(Expense.date).label('day'),
-                func.sum(Expense.amount).label('daily_total'),
-                func.count(Expense.id).label('txn_count'),
-            )
-            .filter(Expense.user_id == user_id,
-                    Expense.type == 'Expense',
-                    Expense.date >= cutoff)
-            .group_by(func.date(Expense.date))
-            .order_by(func.date(Expense.date))
-            .all())
-
-    daily = {}
+    return _to_png(fig)
+
+
+#  Analytics snapshot: every chart and model input from one query
+
+@timed
+def build_snapshot(user_id, days=60):
+    """Fetch every input the charts and models need in a single round trip.
+
+    Category totals come from the rollup table and the daily expense series
+    from the last `days` days of Expense rows (all history when days is None);
+    both halves are index lookups, combined with UNION ALL so the database is
+    hit once. Returns a dict with expense_totals, income_totals, txn_count and
+    the dense daily series as NumPy arrays: dates (datetime64[D]) and amounts.
+    """
+    from models import Expense, ExpenseRollup
+    from sqlalchemy import func, literal, literal_column, select, union_all
+    from __init__ import db
+    from database import day_of
+
+    totals = (select(ExpenseRollup.type,
+                     ExpenseRollup.category,
+                     literal_column('NULL').label('day'),
+                     func.sum(ExpenseRollup.total),
+                     func.sum(ExpenseRollup.count))
+              .where(ExpenseRollup.user_id == user_id)
+              .group_by(ExpenseRollup.type, ExpenseRollup.category))
+    daily = (select(literal('Expense'),
+                    literal_column('NULL'),
+                    day_of(Expense.date),
+                    func.sum(Expense.amount),
+                    func.count(Expense.id))
+             .where(Expense.user_id == user_id,
+                    Expense.type == 'Expense')
+             .group_by(day_of(Expense.date)))
+    if days is not None:
+        daily = daily.where(Expense.date >= datetime.now() - timedelta(days=days))
+
+    snapshot = {'expense_totals': {}, 'income_totals': {}}
+    day_keys, day_totals = [], []
     txn_count = 0
-    for day, daily_total, count in rows:
-        day_str = str(day)
-        daily[day_str] = float(daily_total or 0)
-        txn_count += int(count or 0)
+    for row_type, category, day, total, count in db.session.execute(union_all(totals, daily)):
+        if day is not None:
+            day_keys.append(str(day))
+            day_totals.append(total or 0)
+            txn_count += int(count or 0)
+        elif row_type == 'Income':
+            snapshot['income_totals'][category] = float(total)
+        else:
+            snapshot['expense_totals'][category] = float(total)
+
+    snapshot['dates'], snapshot['amounts'] = _dense_daily_series(
+        np.array(day_keys, dtype='datetime64[D]'), np.array(day_totals, dtype=float))
+    snapshot['txn_count'] = txn_count
+    return snapshot
+
+
+def _dense_daily_series(days, totals, end=None):
+    """Scatter per-day totals onto a dense day range.
+
+    days is a datetime64[D] array (any order, no duplicates) with matching
+    totals. Returns (dates, amounts): every day from the earliest given day
+    through `end` (today by default), with 0 for days without spending.
+    """
+    if end is None:
+        end = np.datetime64(datetime.now().date(), 'D')
+    if days.size == 0:
+        return np.array([], dtype='datetime64[D]'), np.array([], dtype=float)
 
-    if not daily:
-        return [], [], 0
+    start = days.min()
+    dates = np.arange(start, max(end, days.max()) + 1, dtype='datetime64[D]')
+    amounts = np.zeros(dates.size, dtype=float)
+    np.add.at(amounts, (days - start).astype(np.int64), totals)
+    return dates, amounts
 
-    sorted_keys = sorted(daily.keys())
-    start = datetime.strptime(sorted_keys[0], '%Y-%m-%d')
-    end = datetime.now()
 
-    dates, amounts = [], []
-    cur = start
-    while cur <= end:
-        d = cur.strftime('%Y-%m-%d')
-        dates.append(d)
-        amounts.append(daily.get(d, 0))
-        cur += timedelta(days=1)
+#  AI Model 1 : Linear Regression Forecast (least squares, degree 1)
 
-    return dates, amounts, txn_count
+def _window_amounts(start, days, snapshot):
+    """Daily totals of the `days` days from start, taken from a snapshot's dense series."""
+    y = np.zeros(days, dtype=float)
+    offsets = (snapshot['dates'] - np.datetime64(start, 'D')).astype(np.int64)
+    inside = (offsets >= 0) & (offsets < days)
+    y[offsets[inside]] = snapshot['amounts'][inside]
+    return y
 
 
-def generate_forecast(user_id, forecast_days=7):
-    """Build forecast from live spendly.db data for the current user."""
-    dates, amounts, txn_count = _get_daily_spending(user_id, days=60)
+_WEEKDAYS = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday')
+
 
-    if len(amounts) < 3:
+@timed
+def fit_forecast(user_id, forecast_days=7, snapshot=None):
+    """Return the linear trend for the current user.
+
+    The fit comes from the statistics forecasts.py keeps up to date on every
+    write, so this does not refit the window. The weekly-pattern estimate
+    ('seasonal') is read from the nightly Holt-Winters fit when there is a
+    recent one. Returns (forecast, insight); forecast is None when there is
+    too little data, otherwise a dict holding everything
+    render_forecast_chart needs except the daily amounts 'y', which are
+    filled in from the snapshot when one is given.
+    """
+    import forecasts
+    fit = forecasts.current(user_id)
+    seasonal = forecasts.seasonal(user_id, forecast_days)
+
+    if fit['slope'] is None:
         return None, (
-            f"Auto analysis from spendly.db found only {txn_count} expense transaction(s). "
+            f"Auto analysis from spendly.db found only {fit['count']} expense transaction(s). "
             "Add more expenses to generate a forecast."
         )
 
-    x = np.arange(len(amounts), dtype=float)
-    y = np.array(amounts, dtype=float)
+    n = fit['days']
+    slope = fit['slope']
+    # Value of the line at x = 0, the window's first day.
+    intercept = fit['level'] - slope * (n - 1)
 
-    slope, intercept = np.polyfit(x, y, 1)
-
-    total_len = len(amounts) + forecast_days
+    total_len = n + forecast_days
     fx = np.arange(total_len, dtype=float)
     fy = slope * fx + intercept
 
-    buf = io.BytesIO()
-    fig, ax = plt.subplots(figsize=(10, 5), facecolor='#0f172a')
-    _chart_style(fig, ax)
+    direction = 'increasing' if slope > 0 else 'decreasing'
+    avg_daily = fit['sum_y'] / n
+    start_date = str(fit['start'])
+    end_date = str(fit['end'])
+    insight = (
+        "<strong>Auto analysis from spendly.db</strong><br>"
+        f"Based on <strong>{fit['count']}</strong> expense transaction(s) from "
+        f"<strong>{start_date}</strong> to <strong>{end_date}</strong>.<br>"
+        f"Daily spending is <strong>{direction}</strong> by ~Rs {abs(slope):.2f}/day.<br>"
+        f"Average daily spend: <strong>Rs {avg_daily:,.2f}</strong><br>"
+    )
+    if seasonal is not None:
+        # Spending cannot go below zero on any day.
+        seasonal_values = np.maximum(seasonal['values'], 0)
+        offsets = seasonal['weekday_offsets']
+        busiest = int(np.argmax(offsets))
+        insight += (
+            f"Busiest weekday: <strong>{_WEEKDAYS[busiest]}</strong> "
+            f"(~Rs {offsets[busiest]:,.2f} above a typical day)<br>"
+            f"Estimated next {forecast_days} days total (with weekly pattern): "
+            f"<strong>Rs {seasonal_values.sum():,.2f}</strong>"
+        )
+    else:
+        seasonal_values = None
+        next_week_est = max(0, sum(fy[-forecast_days:]))
+        insight += f"Estimated next {forecast_days} days total: <strong>Rs {next_week_est:,.2f}</strong>"
+
+    forecast = {
+        'x': np.arange(n, dtype=float),
+        'y': _window_amounts(fit['start'], n, snapshot) if snapshot is not None else None,
+        'fx': fx,
+        'fy': fy,
+        'slope': float(slope),
+        'intercept': float(intercept),
+        'forecast_days': forecast_days,
+        'start_date': start_date,
+        'end_date': end_date,
+        'seasonal': seasonal_values,
+        # Name shown on /charts: the weekly fit is drawn whenever there is one.
+        'model': 'Holt-Winters (weekly)' if seasonal_values is not None else 'Linear Trend',
+        'signature': _forecast_signature(forecasts.signature(fit), seasonal),
+    }
+    return forecast, insight
+
+
+def _forecast_signature(line_signature, seasonal):
+    if seasonal is None:
+        return line_signature
+    return f"{line_signature}-hw{seasonal['through']}-{round(sum(seasonal['values']))}"
+
+
+def forecast_version(user_id):
+    """Cache version of the forecast chart: changes only when the fitted line
+    moves or the nightly seasonal forecast is refitted.
+    """
+    import forecasts
+    return _forecast_signature(forecasts.signature(forecasts.current(user_id)),
+                               forecasts.seasonal(user_id))
+
+
+@timed
+def render_forecast_chart(forecast):
+    """Render the daily spending bars with the fitted trend and return PNG bytes."""
+    x, y, fx, fy = forecast['x'], forecast['y'], forecast['fx'], forecast['fy']
+    forecast_days = forecast['forecast_days']
+    total_len = len(fx)
+
+    fig, ax = _figure((10, 5))
 
     ax.bar(x, y, color='#6366f1', alpha=0.45, width=0.8, label='Daily Spending', zorder=2)
     ax.plot(fx, fy, color='#34d399', linewidth=2.5, linestyle='--',
             label=f'Trend + {forecast_days}-Day Forecast', zorder=3)
+    seasonal = forecast.get('seasonal')
+    if seasonal is not None:
+        ax.plot(fx[-len(seasonal):], seasonal, color='#fbbf24', linewidth=2, marker='o',
+                markersize=5, label='Forecast with Weekly Pattern', zorder=4)
 
     # Shade forecast area
-    ax.axvspan(len(amounts) - 0.5, total_len - 0.5, alpha=0.08, color='#34d399')
-    ax.axvline(len(amounts) - 0.5, color='#fbbf24', linewidth=1, linestyle=':', alpha=0.7)
+    ax.axvspan(len(y) - 0.5, total_len - 0.5, alpha=0.08, color='#34d399')
+    ax.axvline(len(y) - 0.5, color='#fbbf24', linewidth=1, linestyle=':', alpha=0.7)
 
     ax.set_title('Auto Spending Forecast (from spendly.db)', fontsize=14, fontweight='bold', pad=12)
     ax.set_xlabel('Day', fontsize=11)
     ax.set_ylabel('Amount (Rs)', fontsize=11)
     ax.legend(facecolor='#1e293b', edgecolor='#334155', labelcolor='#e2e8f0', fontsize=9)
 
-    plt.tight_layout()
-    plt.savefig(buf, format='png', facecolor='#0f172a', edgecolor='none', dpi=120)
-    plt.close(fig)
-    buf.seek(0)
+    return _to_png(fig)
 
-    direction = 'increasing' if slope > 0 else 'decreasing'
-    next_week_est = max(0, sum(fy[-forecast_days:]))
-    avg_daily = np.mean(y)
-    start_date = dates[0] if dates else 'N/A'
-    end_date = dates[-1] if dates else 'N/A'
-    insight = (
-        "<strong>Auto analysis from spendly.db</strong><br>"
-        f"Based on <strong>{txn_count}</strong> expense transaction(s) from "
-        f"<strong>{start_date}</strong> to <strong>{end_date}</strong>.<br>"
-        f"Daily spending is <strong>{direction}</strong> by ~Rs {abs(slope):.2f}/day.<br>"
-        f"Average daily spend: <strong>Rs {avg_daily:,.2f}</strong><br>"
-        f"Estimated next {forecast_days} days total: <strong>Rs {next_week_est:,.2f}</strong>"
-    )
 
-    return _to_b64(buf.getvalue()), insight
+@timed
+def generate_forecast(user_id, forecast_days=7):
+    """Build forecast from live spendly.db data for the current user."""
+    forecast, insight = fit_forecast(user_id, forecast_days, snapshot=build_snapshot(user_id))
+    if forecast is None:
+        return None, insight
+    return _to_b64(render_forecast_chart(forecast)), insight
 
 
 #  AI Model 2 : Z-Score Anomaly Detection
 
-def detect_anomalies(user_id, threshold=2.0):
+@timed
+def detect_anomalies(user_id, threshold=2.0, days=60):
     """
     AI Model: Z-Score Anomaly Detection (NumPy).
-    Returns list of anomaly dicts with date, amount, z_score.
+    Returns list of anomaly dicts with date, amount, z_score, severity for the
+    last `days` days. Days are scored as transactions are written (see
+    anomalies.py), so this only reads the flagged ones.
     """
-    dates, amounts, _ = _get_daily_spending(user_id, days=60)
-
-    if len(amounts) < 5:
-        return []
-
-    data = np.array(amounts, dtype=float)
-    mean = np.mean(data)
-    std  = np.std(data)
+    import anomalies
+    return anomalies.recent(user_id, days, threshold)
 
-    if std == 0:
-        return []
 
-    anomalies = []
-    for i, (date, amt) in enumerate(zip(dates, amounts)):
-        z = (amt - mean) / std
-        if z > threshold:
-            anomalies.append({
-                'date': date,
-                'amount': round(amt, 2),
-                'z_score': round(z, 2),
-                'severity': 'High' if z > 3 else 'Medium',
-            })
-
-    return anomalies
+@timed
+def detect_breakdown_anomalies(user_id, threshold=3.0, days=60):
+    """
+    Z-Score Anomaly Detection per category and per account (payment mode).
+    Returns anomaly dicts like detect_anomalies plus dimension, key and label,
+    as scored in batch (anomalies.rebuild_breakdowns), nightly and by the
+    analytics job queued after each write.
+    """
+    import anomalies
+    return anomalies.recent_breakdowns(user_id, days, threshold)
 
 
 
 #  High-level function used by the /charts route
 
+@timed
 def render_income_vs_expense_pie(expense_totals, income_totals, title='Income vs Expense'):
     """Render one pie chart that compares total income and total expense."""
     total_expense = sum(expense_totals.values()) if expense_totals else 0
     total_income = sum(income_totals.values()) if income_totals else 0
 
-    buf = io.BytesIO()
-    fig, ax = plt.subplots(figsize=(7, 7), facecolor='#0f172a')
-    ax.set_facecolor('#0f172a')
+    fig, ax = _figure((7, 7), styled=False)
 
     if total_expense > 0 or total_income > 0:
         _, _, autotexts = ax.pie(
@@ -423,40 +555,122 @@ def render_income_vs_expense_pie(expense_totals, income_totals, title='Income vs
                 transform=ax.transAxes)
         ax.set_axis_off()
 
-    plt.tight_layout()
-    plt.savefig(buf, format='png', facecolor='#0f172a', edgecolor='none', dpi=120)
-    plt.close(fig)
-    buf.seek(0)
-    return buf.getvalue()
+    return _to_png(fig)
 
 
-def generate_all_charts(user_id):
-    
-    exp_totals = get_expense_category_totals(user_id)
-    inc_totals = get_income_category_totals(user_id)
-
-    merged_pie_b64 = _to_b64(render_income_vs_expense_pie(exp_totals, inc_totals, 'Income vs Expense'))
-    merged_bar_b64 = _to_b64(render_merged_bar_chart(exp_totals, inc_totals, 'Income vs Expense by Category'))
-    merged_line_b64 = _to_b64(render_merged_line_chart(exp_totals, inc_totals, 'Income & Expense Comparison'))
-
-    result = {
-        # Feed merged charts into both toggle states for consistent behavior.
-        'pie_expense_b64': merged_pie_b64,
-        'pie_income_b64': merged_pie_b64,
-        'bar_expense_b64': merged_bar_b64,
-        'bar_income_b64': merged_bar_b64,
-        'merged_pie_b64': merged_pie_b64,
-        'merged_bar_b64': merged_bar_b64,
-        'merged_line_b64': merged_line_b64,
-        'forecast_b64': None,
-        'forecast_insight': '',
-        'anomalies': [],
-    }
+def chart_render_jobs(user_id, kinds, snapshot=None):
+    """Describe how to render each requested /charts image.
+
+    Returns {kind: (function_name, args)} naming a module-level render_*
+    function and its picklable arguments, so the work can run here or in a
+    render_pool worker. The forecast is left out when there is too little data.
+    """
+    if snapshot is None:
+        snapshot = build_snapshot(user_id)
+    exp_totals = snapshot['expense_totals']
+    inc_totals = snapshot['income_totals']
+
+    jobs = {}
+    for kind in kinds:
+        if kind == 'forecast':
+            forecast, _ = fit_forecast(user_id, snapshot=snapshot)
+            if forecast is not None:
+                jobs[kind] = ('render_forecast_chart', (forecast,))
+        elif kind == 'merged_pie':
+            jobs[kind] = ('render_income_vs_expense_pie', (exp_totals, inc_totals, 'Income vs Expense'))
+        elif kind == 'merged_bar':
+            jobs[kind] = ('render_merged_bar_chart', (exp_totals, inc_totals, 'Income vs Expense by Category'))
+        elif kind == 'merged_line':
+            jobs[kind] = ('render_merged_line_chart', (exp_totals, inc_totals, 'Income & Expense Comparison'))
+        else:
+            raise ValueError(f'Unknown chart kind: {kind}')
+    return jobs
+
+
+def run_render_job(function_name, args):
+    """Execute one job produced by chart_render_jobs and return PNG bytes."""
+    return globals()[function_name](*args)
+
+
+@timed
+def render_chart(user_id, kind, snapshot=None):
+    """Render one /charts image for the user and return PNG bytes.
+
+    Returns None for the forecast when there is not enough data to fit it.
+    """
+    job = chart_render_jobs(user_id, [kind], snapshot).get(kind)
+    return run_render_job(*job) if job is not None else None
+
 
-    forecast_b64, forecast_insight = generate_forecast(user_id)
-    result['forecast_b64'] = forecast_b64
-    result['forecast_insight'] = forecast_insight
-    result['anomalies'] = detect_anomalies(user_id)
+CHART_KINDS = ('merged_pie', 'merged_bar', 'merged_line', 'forecast')
 
-    return result
+CHART_DATA_KINDS = ('category_totals', 'merged', 'forecast', 'anomalies')
 
+
+def _rounded(values):
+    return [round(float(v), 2) for v in values]
+
+
+@timed
+def chart_data(user_id, kind, snapshot=None):
+    """Return the JSON-serialisable inputs behind a chart, for client-side drawing.
+
+    Mirrors what the render_* functions consume, so the browser can draw the
+    same charts while the server only aggregates.
+    """
+    if kind == 'anomalies':
+        return {'anomalies': detect_anomalies(user_id),
+                'breakdown': detect_breakdown_anomalies(user_id)}
+    if snapshot is None:
+        snapshot = build_snapshot(user_id)
+    exp_totals = snapshot['expense_totals']
+    inc_totals = snapshot['income_totals']
+
+    if kind == 'category_totals':
+        return {
+            'expense': {cat: round(val, 2) for cat, val in exp_totals.items()},
+            'income': {cat: round(val, 2) for cat, val in inc_totals.items()},
+        }
+    if kind == 'merged':
+        categories = sorted(set(exp_totals) | set(inc_totals))
+        return {
+            'categories': categories,
+            'expense': _rounded(exp_totals.get(cat, 0) for cat in categories),
+            'income': _rounded(inc_totals.get(cat, 0) for cat in categories),
+        }
+    if kind == 'forecast':
+        forecast, insight = fit_forecast(user_id, snapshot=snapshot)
+        if forecast is None:
+            return {'forecast': None, 'insight': insight}
+        return {
+            'forecast': {
+                # Days are consecutive from start, so the dates are implied.
+                'start': forecast['start_date'],
+                'amounts': _rounded(forecast['y']),
+                'trend': _rounded(forecast['fy']),
+                'seasonal': _rounded(forecast['seasonal']) if forecast['seasonal'] is not None else None,
+                'model': forecast['model'],
+                'forecast_days': forecast['forecast_days'],
+                'slope': round(forecast['slope'], 4),
+                'intercept': round(forecast['intercept'], 4),
+            },
+            'insight': insight,
+        }
+    raise ValueError(f'Unknown chart data kind: {kind}')
+
+
+@timed
+def generate_all_charts(user_id):
+    """Return the non-image data for the /charts page.
+
+    The images themselves are served by URL (see render_chart) so the browser
+    can cache them. Everything here reads stored results, without a snapshot.
+    """
+    forecast, forecast_insight = fit_forecast(user_id)
+    return {
+        'forecast_available': forecast is not None,
+        'forecast_model': forecast['model'] if forecast is not None else 'Linear Trend',
+        'forecast_insight': forecast_insight,
+        'anomalies': detect_anomalies(user_id),
+        'breakdown_anomalies': detect_breakdown_anomalies(user_id),
+    }
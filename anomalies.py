@@ -0,0 +1,428 @@
+"""Online anomaly detection over each user's daily expense totals.
+
+Every user has a SpendingStats row holding an exponentially weighted mean and
+variance of their daily spending. Expense writes fold into it as they happen
+(record_expense), so a day is flagged the moment its total crosses the
+threshold and /charts only reads the stored SpendingAnomaly rows.
+score_history runs the same recurrence over many users' histories in one
+NumPy pass, for backfills and repairs (rebuild).
+
+Spending per category and per account is scored the same way, but in
+batch (rebuild_breakdowns): nightly for everyone, and for one user by the
+analytics job queued after their writes (jobs.py), rather than in the write.
+"""
+import math
+import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+from sqlalchemy import String, func, insert, literal, select, type_coerce, union_all
+
+from __init__ import db
+from database import day_of
+from models import Account, Expense, SpendingAnomaly, SpendingBreakdownAnomaly, SpendingStats, User
+
+# Each day's weight in the running stats. A 60-day span matches the window
+# the old full recompute used; older spending fades out instead of diluting
+# the baseline of a multi-year history.
+SPAN_DAYS = 60
+ALPHA = 2 / (SPAN_DAYS + 1)
+# Days of history needed before a day can be flagged.
+MIN_DAYS = 5
+# Lowest z-score stored. Lookups can ask for a higher threshold, not a lower one.
+THRESHOLD = 2.0
+# Floor on the standard deviation (Rs), so a near-constant history does not
+# turn a small change into a huge z-score.
+MIN_STD = 1.0
+REBUILD_BATCH_SIZE = 500
+# Float drift in a running day total; anything below this is no spending.
+TOLERANCE = 0.005
+
+
+def _fold(days, mean, var, amount):
+    """Fold one day's total into (days, mean, var)."""
+    if days == 0:
+        return 1, amount, 0.0
+    diff = amount - mean
+    incr = ALPHA * diff
+    return days + 1, mean + incr, (1 - ALPHA) * (var + diff * incr)
+
+
+def _fold_zeros(days, mean, var, count):
+    """Fold `count` days without spending at once; the closed form of repeated _fold(.., 0)."""
+    decay = (1 - ALPHA) ** count
+    return days + count, mean * decay, decay * (var + mean * mean * (1 - decay))
+
+
+def z_score(days, mean, var, amount):
+    """Score a day's total against the stats before it; None until MIN_DAYS are folded."""
+    if days < MIN_DAYS:
+        return None
+    return (amount - mean) / max(math.sqrt(var), MIN_STD)
+
+
+def _as_dict(day, amount, z, threshold=THRESHOLD):
+    return {
+        'date': day.isoformat(),
+        'amount': round(amount, 2),
+        'z_score': round(z, 2),
+        # 3 sigma for daily totals.
+        'severity': 'High' if z > 1.5 * threshold else 'Medium',
+    }
+
+
+def record_expense(expense, sign=1):
+    """Fold one expense write (sign=1) or removal (sign=-1) into the user's stats.
+
+    Runs inside the caller's transaction, after the write or delete is
+    flushed. A write on the open day or a later one costs one row read; one
+    that rewrites older history (a backdated row, deleting an older
+    expense, or emptying the open day) rescores the user with score_history
+    instead. Returns the anomaly dict for the expense's day when that day
+    is flagged, else None.
+    """
+    if expense.type != 'Expense':
+        return None
+    day = expense.date.date()
+    stats = db.session.get(SpendingStats, expense.user_id, with_for_update=True)
+    # With no spending left on it, the open day drops out of the history and
+    # the day before it with spending becomes the open day again.
+    emptied = (stats is not None and sign < 0 and day == stats.day
+               and stats.day_total - expense.amount <= TOLERANCE)
+    if stats is None or (stats.day is not None and day < stats.day) or emptied:
+        _rescore([expense.user_id])
+        row = (db.session.query(SpendingAnomaly.amount, SpendingAnomaly.z_score)
+               .filter_by(user_id=expense.user_id, day=day)
+               .first())
+        return _as_dict(day, *row) if row is not None else None
+
+    if stats.day is None or day > stats.day:
+        if stats.day is not None:
+            days, mean, var = _fold(stats.days, stats.mean, stats.var, stats.day_total)
+            gap = (day - stats.day).days - 1
+            if gap:
+                days, mean, var = _fold_zeros(days, mean, var, gap)
+            stats.days, stats.mean, stats.var = days, mean, var
+        stats.day, stats.day_total = day, 0.0
+    stats.day_total += expense.amount * sign
+
+    z = z_score(stats.days, stats.mean, stats.var, stats.day_total)
+    flagged = z is not None and z > THRESHOLD
+    existing = None
+    if flagged or sign < 0:
+        # An insert only raises the open day's total, so an unflagged day
+        # never has a row to clear; only a removal can lower it.
+        existing = SpendingAnomaly.query.filter_by(user_id=expense.user_id, day=day).first()
+    if flagged:
+        if existing is None:
+            existing = SpendingAnomaly(user_id=expense.user_id, day=day)
+            db.session.add(existing)
+        existing.amount, existing.z_score = stats.day_total, z
+        return _as_dict(day, stats.day_total, z)
+    if existing is not None:
+        db.session.delete(existing)
+    return None
+
+
+#  Batch mode
+
+def scan(amounts, starts, skip_zeros=False):
+    """Run the online recurrence over many users' histories at once.
+
+    amounts is a (days, users) array of daily totals, one column per user,
+    aligned so the last row is every user's open day; column i starts at row
+    starts[i]. Loops over days and vectorises across users. Returns
+    (days, mean, var) per user after folding everything but the open day, and
+    the (days, users) z-scores of each day against the stats before it (NaN
+    where a day cannot be scored). With skip_zeros, days without spending are
+    left out of the stats, so they describe a typical day with spending.
+    """
+    n_days, n_users = amounts.shape
+    days = np.zeros(n_users, dtype=np.int64)
+    mean = np.zeros(n_users)
+    var = np.zeros(n_users)
+    z = np.full(amounts.shape, np.nan)
+    for t, x in enumerate(amounts):
+        z[t] = np.where(days >= MIN_DAYS, (x - mean) / np.maximum(np.sqrt(var), MIN_STD), np.nan)
+        if t == n_days - 1:
+            break
+        active = starts <= t
+        if skip_zeros:
+            active &= x > 0
+        first = days == 0
+        diff = x - mean
+        incr = ALPHA * diff
+        mean = np.where(active, np.where(first, x, mean + incr), mean)
+        var = np.where(active & ~first, (1 - ALPHA) * (var + diff * incr), var)
+        days += active
+    return days, mean, var, z
+
+
+def _scan_series(column, day_numbers, totals, n_series, skip_zeros=False):
+    """Lay (series, day, total) entries out as a (day x series) matrix and scan it.
+
+    column holds each entry's series index in range(n_series) and day_numbers
+    its day as days since the epoch. Every series is shifted so it ends on the
+    last row. Returns (amounts, shift, last, days, mean, var, z); a series'
+    row t is day t - shift. skip_zeros is passed on to scan.
+    """
+    first = np.full(n_series, np.iinfo(np.int64).max)
+    last = np.full(n_series, np.iinfo(np.int64).min)
+    np.minimum.at(first, column, day_numbers)
+    np.maximum.at(last, column, day_numbers)
+
+    n_days = int((last - first).max()) + 1
+    shift = (n_days - 1) - last
+    amounts = np.zeros((n_days, n_series))
+    np.add.at(amounts, (day_numbers + shift[column], column), totals)
+    days, mean, var, z = scan(amounts, first + shift, skip_zeros)
+    return amounts, shift, last, days, mean, var, z
+
+
+def _flagged(amounts, shift, z, threshold):
+    """Yield (series, day, amount, z) for every scored day above threshold."""
+    t, i = np.nonzero(z > threshold)
+    flagged_days = (t - shift[i]).astype('datetime64[D]').tolist()
+    return zip(i.tolist(), flagged_days, amounts[t, i].tolist(), z[t, i].tolist())
+
+
+def _day_numbers(days):
+    return np.array([str(day) for day in days], dtype='datetime64[D]').astype(np.int64)
+
+
+def score_history(rows, user_ids=()):
+    """Score whole histories from (user_id, day, total) rows in one vectorised pass.
+
+    rows hold one entry per user and day with spending, days as dates or
+    'YYYY-MM-DD' strings. Users in user_ids without any rows still get empty
+    stats. Returns (stats, flagged): lists of dicts keyed like the
+    spending_stats and spending_anomaly columns.
+    """
+    rows = list(rows)
+    users_seen = set()
+    stats, flagged = [], []
+    if rows:
+        owners = np.array([row[0] for row in rows], dtype=np.int64)
+        totals = np.array([row[2] or 0 for row in rows], dtype=float)
+        users, column = np.unique(owners, return_inverse=True)
+        amounts, shift, last, days, mean, var, z = _scan_series(
+            column, _day_numbers(row[1] for row in rows), totals, users.size)
+
+        open_days = last.astype('datetime64[D]').tolist()
+        for values in zip(users.tolist(), open_days, amounts[-1].tolist(),
+                          days.tolist(), mean.tolist(), var.tolist()):
+            stats.append(dict(zip(('user_id', 'day', 'day_total', 'days', 'mean', 'var'), values)))
+        users_seen.update(users.tolist())
+
+        user_list = users.tolist()
+        for i, day, amount, score in _flagged(amounts, shift, z, THRESHOLD):
+            flagged.append({'user_id': user_list[i], 'day': day, 'amount': amount, 'z_score': score})
+
+    for user_id in user_ids:
+        if user_id not in users_seen:
+            stats.append({'user_id': user_id, 'day': None, 'day_total': 0.0,
+                          'days': 0, 'mean': 0.0, 'var': 0.0})
+    return stats, flagged
+
+
+def _daily_totals(user_ids):
+    # Days only go on to NumPy as strings; skip parsing them into dates.
+    day = type_coerce(day_of(Expense.date), String)
+    return (db.session.query(Expense.user_id, day, func.sum(Expense.amount))
+            .filter(Expense.user_id.in_(user_ids), Expense.type == 'Expense')
+            .group_by(Expense.user_id, day)
+            .all())
+
+
+def _rescore(user_ids):
+    """Replace the users' stats and flagged days, inside the caller's transaction."""
+    stats, flagged = score_history(_daily_totals(user_ids), user_ids)
+    SpendingAnomaly.query.filter(SpendingAnomaly.user_id.in_(user_ids)).delete(synchronize_session=False)
+    SpendingStats.query.filter(SpendingStats.user_id.in_(user_ids)).delete(synchronize_session=False)
+    db.session.execute(insert(SpendingStats), stats)
+    if flagged:
+        db.session.execute(insert(SpendingAnomaly), flagged)
+
+
+def check_consistency(user_id=None):
+    """Compare the stored stats with a score_history recompute (all users, or one user).
+
+    Returns a list of mismatch dicts; an empty list means the online updates
+    agree with the batch scoring.
+    """
+    if user_id is not None:
+        user_ids = [user_id]
+    else:
+        user_ids = [row[0] for row in db.session.query(User.id).order_by(User.id)]
+    expected, _ = score_history(_daily_totals(user_ids), user_ids)
+    stored = {s.user_id: s for s in SpendingStats.query.filter(SpendingStats.user_id.in_(user_ids))}
+
+    mismatches = []
+    for want in expected:
+        have = stored.get(want['user_id'])
+        if have is None and want['days'] == 0:
+            # Users with no expenses yet (new sign-ups, income only) have no row.
+            continue
+        have = {name: getattr(have, name) for name in want} if have is not None else None
+        if (have is None or (have['day'], have['days']) != (want['day'], want['days'])
+                or any(not math.isclose(have[name], want[name], rel_tol=1e-6, abs_tol=TOLERANCE)
+                       for name in ('day_total', 'mean', 'var'))):
+            mismatches.append({'user_id': want['user_id'], 'expected': want, 'stored': have})
+    return mismatches
+
+
+def _in_batches(rescore, user_id, batch_size, log):
+    """Call rescore(user_ids) for every user, one user or a list of users, committing after each batch."""
+    if isinstance(user_id, (list, tuple)):
+        user_ids = list(user_id)
+    elif user_id is not None:
+        user_ids = [user_id]
+    else:
+        user_ids = [row[0] for row in db.session.query(User.id).order_by(User.id)]
+    started = time.perf_counter()
+    for start in range(0, len(user_ids), batch_size):
+        rescore(user_ids[start:start + batch_size])
+        db.session.commit()
+        if log:
+            done = min(start + batch_size, len(user_ids))
+            log(f"  {done}/{len(user_ids)} users ({done / (time.perf_counter() - started):,.0f} users/s)")
+    return len(user_ids)
+
+
+def rebuild(user_id=None, batch_size=REBUILD_BATCH_SIZE, log=None):
+    """Recompute stats and flagged days from Expense (all users, one user or a list of users).
+
+    Users are scored batch_size at a time, one NumPy pass and one commit per
+    batch. Cached charts are not invalidated; callers that need it bump the
+    data version. Returns the number of users scored.
+    """
+    return _in_batches(_rescore, user_id, batch_size, log)
+
+
+def recent(user_id, days=60, threshold=THRESHOLD):
+    """Return the flagged days of the last `days` days, oldest first.
+
+    Reads stored flags only, a short index range however long the history.
+    A threshold below THRESHOLD finds nothing extra: those days were never stored.
+    """
+    since = date.today() - timedelta(days=days)
+    rows = (db.session.query(SpendingAnomaly.day, SpendingAnomaly.amount, SpendingAnomaly.z_score)
+            .filter(SpendingAnomaly.user_id == user_id,
+                    SpendingAnomaly.day >= since,
+                    SpendingAnomaly.z_score > threshold)
+            .order_by(SpendingAnomaly.day)
+            .all())
+    return [_as_dict(day, amount, z) for day, amount, z in rows]
+
+
+#  Per-category and per-account scoring (nightly batch)
+
+# Columns a user's spending is broken down by; each value is its own daily series.
+BREAKDOWNS = {
+    'category': Expense.category,
+    'account': Expense.payment_mode,
+}
+# A user has a dozen or more of these series, so some series would cross
+# 2 sigma most weeks by chance; breakdowns use a stricter threshold.
+BREAKDOWN_THRESHOLD = 3.0
+# Days of history each run scores, and the most recent of them it keeps
+# flags for; the earlier days only warm up the stats.
+BREAKDOWN_HISTORY_DAYS = 180
+BREAKDOWN_DAYS = 60
+
+
+def score_breakdowns(rows, keep_from=None):
+    """Score every (user, dimension, key) daily series in one vectorised pass.
+
+    rows hold (user_id, dimension, key, day, total) entries, one per series
+    and day with spending; rows without a key are skipped. All series go into
+    a single (day x series) matrix, so a batch of users with a dozen
+    categories and accounts each is one scan. Most categories see spending
+    on a few days a month, so each day with spending is compared with the
+    series' other days with spending, not with a baseline of empty days.
+    Returns flagged-day dicts keyed like the spending_breakdown_anomaly
+    columns, for days on or after keep_from (a date) when given.
+    """
+    series, column, days, totals = {}, [], [], []
+    for user_id, dimension, key, day, total in rows:
+        if not key:
+            continue
+        column.append(series.setdefault((user_id, dimension, key), len(series)))
+        days.append(day)
+        totals.append(total or 0)
+    if not series:
+        return []
+
+    amounts, shift, _, _, _, _, z = _scan_series(
+        np.array(column, dtype=np.int64), _day_numbers(days), np.array(totals, dtype=float),
+        len(series), skip_zeros=True)
+    keys = list(series)
+    flagged = []
+    for i, day, amount, score in _flagged(amounts, shift, z, BREAKDOWN_THRESHOLD):
+        if keep_from is not None and day < keep_from:
+            continue
+        user_id, dimension, key = keys[i]
+        flagged.append({'user_id': user_id, 'dimension': dimension, 'key': key,
+                        'day': day, 'amount': amount, 'z_score': score})
+    return flagged
+
+
+def _breakdown_totals(user_ids, since):
+    """Daily totals per user and breakdown key since `since`, all dimensions in one query."""
+    day = type_coerce(day_of(Expense.date), String)
+    selects = [
+        select(Expense.user_id, literal(dimension), column, day, func.sum(Expense.amount))
+        .where(Expense.user_id.in_(user_ids),
+               Expense.type == 'Expense',
+               Expense.date >= datetime.combine(since, datetime.min.time()),
+               column.isnot(None))
+        .group_by(Expense.user_id, column, day)
+        for dimension, column in BREAKDOWNS.items()
+    ]
+    return db.session.execute(union_all(*selects)).all()
+
+
+def _rescore_breakdowns(user_ids, today=None):
+    today = today or date.today()
+    since = today - timedelta(days=BREAKDOWN_HISTORY_DAYS - 1)
+    flagged = score_breakdowns(_breakdown_totals(user_ids, since),
+                               keep_from=today - timedelta(days=BREAKDOWN_DAYS))
+    (SpendingBreakdownAnomaly.query
+     .filter(SpendingBreakdownAnomaly.user_id.in_(user_ids))
+     .delete(synchronize_session=False))
+    if flagged:
+        db.session.execute(insert(SpendingBreakdownAnomaly), flagged)
+
+
+def rebuild_breakdowns(user_id=None, batch_size=REBUILD_BATCH_SIZE, log=None):
+    """Rescore per-category and per-account days (all users, one user or a list of users).
+
+    Meant to run nightly: the flags are a day old at most, and each batch of
+    users costs one query and one NumPy pass. Returns the number of users scored.
+    """
+    return _in_batches(_rescore_breakdowns, user_id, batch_size, log)
+
+
+def recent_breakdowns(user_id, days=BREAKDOWN_DAYS, threshold=BREAKDOWN_THRESHOLD):
+    """Return flagged category and account days of the last `days` days, oldest first.
+
+    Each dict adds dimension ('category' or 'account'), key, and a label:
+    the account name when the payment mode is an account id, else the key.
+    """
+    since = date.today() - timedelta(days=days)
+    rows = (db.session.query(SpendingBreakdownAnomaly.dimension, SpendingBreakdownAnomaly.key,
+                             SpendingBreakdownAnomaly.day, SpendingBreakdownAnomaly.amount,
+                             SpendingBreakdownAnomaly.z_score)
+            .filter(SpendingBreakdownAnomaly.user_id == user_id,
+                    SpendingBreakdownAnomaly.day >= since,
+                    SpendingBreakdownAnomaly.z_score > threshold)
+            .order_by(SpendingBreakdownAnomaly.day, SpendingBreakdownAnomaly.dimension,
+                      SpendingBreakdownAnomaly.key)
+            .all())
+    names = {}
+    if any(row.dimension == 'account' for row in rows):
+        names = {str(account_id): name for account_id, name in
+                 db.session.query(Account.id, Account.name).filter(Account.user_id == user_id)}
+    return [dict(_as_dict(day, amount, z, BREAKDOWN_THRESHOLD), dimension=dimension, key=key,
+                 label=names.get(key, key) if dimension == 'account' else key)
+            for dimension, key, day, amount, z in rows]
@@ -0,0 +1,109 @@
+"""Measure streaming export throughput (rows/second) and peak memory.
+
+Builds a throwaway database with one user holding --rows transactions, then
+downloads /export.csv and /export.ndjson through the Flask test client.
+
+    python benchmarks/bench_export.py [--rows 1000000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert  # noqa: E402
+from werkzeug.security import generate_password_hash  # noqa: E402
+
+from __init__ import create_app, db  # noqa: E402
+from models import Expense, User  # noqa: E402
+
+INSERT_BATCH = 50_000
+
+
+def populate(rows):
+    user = User(email='bench@example.com', first_name='Bench',
+                password=generate_password_hash('benchmark'), gender='Other', number='1234567')
+    db.session.add(user)
+    db.session.commit()
+
+    rng = random.Random(42)
+    start = datetime.now() - timedelta(days=3 * 365)
+    categories = ['Food', 'Bills', 'Shopping', 'Transportation', 'Health']
+    for offset in range(0, rows, INSERT_BATCH):
+        batch = [{
+            'amount': round(rng.uniform(5, 500), 2),
+            'category': rng.choice(categories),
+            'type': 'Expense',
+            'description': f'Benchmark row {i}',
+            'payment_mode': 'Cash',
+            'date': start + timedelta(minutes=i),
+            'user_id': user.id,
+        } for i in range(offset, min(offset + INSERT_BATCH, rows))]
+        db.session.execute(insert(Expense), batch)
+        db.session.commit()
+
+
+def stream(client, url):
+    """Download url chunk by chunk; return (lines, bytes)."""
+    response = client.get(url, buffered=False)
+    lines = 0
+    size = 0
+    for chunk in response.response:
+        lines += chunk.count(b'\n' if isinstance(chunk, bytes) else '\n')
+        size += len(chunk)
+    response.close()
+    return lines, size
+
+
+def measure(client, url, trace_memory):
+    started = time.perf_counter()
+    lines, size = stream(client, url)
+    elapsed = time.perf_counter() - started
+
+    peak = None
+    if trace_memory:
+        # tracemalloc slows allocation-heavy code several times over, so the
+        # memory pass is separate from the timed one.
+        tracemalloc.start()
+        stream(client, url)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return lines, size, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--no-memory', action='store_true',
+                        help='skip the (slow) traced pass that measures peak memory')
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    try:
+        app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}'})
+        with app.app_context():
+            started = time.perf_counter()
+            populate(args.rows)
+            print(f'Inserted {args.rows:,} rows in {time.perf_counter() - started:.1f}s')
+
+        client = app.test_client()
+        client.post('/login', data={'email': 'bench@example.com', 'password': 'benchmark'})
+        for url in ('/export.csv', '/export.ndjson'):
+            lines, size, elapsed, peak = measure(client, url, not args.no_memory)
+            memory = f'  peak {peak / 1e6:6.1f} MB' if peak is not None else ''
+            print(f'{url:16} {lines:>10,} lines {size / 1e6:8.1f} MB {elapsed:7.2f}s '
+                  f'{args.rows / elapsed:>10,.0f} rows/s{memory}')
+        with app.app_context():
+            db.engine.dispose()
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
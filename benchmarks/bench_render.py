@@ -0,0 +1,90 @@
+"""Time each render_* function against a pyplot reference implementation.
+
+The reference builds and tears down a pyplot figure per image, the way the
+renderers used to; the render_* functions reuse per-thread Figure templates.
+
+    python benchmarks/bench_render.py [--iterations 30]
+"""
+import argparse
+import io
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+import matplotlib  # noqa: E402
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt  # noqa: E402
+
+import ai_models  # noqa: E402
+
+EXPENSES = {'Food': 5400.0, 'Bills': 3200.0, 'Shopping': 2100.5, 'Transportation': 950.0,
+            'Health': 700.0, 'Entertainment': 640.0, 'Education': 1800.0}
+INCOME = {'Salary': 42000.0, 'Interest': 1300.0, 'Gift': 500.0}
+
+
+def _forecast():
+    y = np.abs(np.random.default_rng(0).normal(150, 40, 60))
+    x = np.arange(60, dtype=float)
+    slope, intercept = np.polyfit(x, y, 1)
+    fx = np.arange(67, dtype=float)
+    return {'x': x, 'y': y, 'fx': fx, 'fy': slope * fx + intercept, 'slope': slope,
+            'intercept': intercept, 'forecast_days': 7, 'end_date': 'N/A'}
+
+
+def pyplot_bar_reference(category_totals):
+    buf = io.BytesIO()
+    fig, ax = plt.subplots(figsize=(9, 5), facecolor='#0f172a')
+    ai_models._chart_style(fig, ax)
+    cats = list(category_totals.keys())
+    vals = list(category_totals.values())
+    bars = ax.bar(cats, vals, color='#818cf8', edgecolor='#0f172a',
+                  linewidth=1.5, width=0.55, zorder=3)
+    for bar, val in zip(bars, vals):
+        ax.text(bar.get_x() + bar.get_width()/2, bar.get_height() + max(vals)*0.02,
+                f'₹{val:,.0f}', ha='center', va='bottom',
+                color='#e2e8f0', fontsize=9, fontweight='bold')
+    ax.set_ylabel('Amount (₹)', fontsize=11)
+    ax.set_title('Expenses by Category', fontsize=14, fontweight='bold', pad=12)
+    plt.xticks(rotation=25, ha='right', fontsize=9)
+    plt.tight_layout()
+    plt.savefig(buf, format='png', facecolor='#0f172a', edgecolor='none', dpi=120)
+    plt.close(fig)
+    return buf.getvalue()
+
+
+CASES = {
+    'pyplot_bar_reference': lambda: pyplot_bar_reference(EXPENSES),
+    'render_bar_chart': lambda: ai_models.render_bar_chart(EXPENSES),
+    'render_pie_chart': lambda: ai_models.render_pie_chart(EXPENSES),
+    'render_line_chart': lambda: ai_models.render_line_chart(EXPENSES),
+    'render_merged_bar_chart': lambda: ai_models.render_merged_bar_chart(EXPENSES, INCOME),
+    'render_merged_line_chart': lambda: ai_models.render_merged_line_chart(EXPENSES, INCOME),
+    'render_income_vs_expense_pie': lambda: ai_models.render_income_vs_expense_pie(EXPENSES, INCOME),
+    'render_forecast_chart': lambda: ai_models.render_forecast_chart(_forecast()),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=30)
+    args = parser.parse_args()
+
+    print(f"{'case':32} {'p50 ms':>9} {'p95 ms':>9}")
+    for name, case in CASES.items():
+        case()  # warm up fonts and the figure template
+        samples = []
+        for _ in range(args.iterations):
+            start = time.perf_counter()
+            case()
+            samples.append((time.perf_counter() - start) * 1000)
+        samples.sort()
+        p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+        print(f'{name:32} {statistics.median(samples):9.1f} {p95:9.1f}')
+
+
+if __name__ == '__main__':
+    main()
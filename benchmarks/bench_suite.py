@@ -0,0 +1,233 @@
+"""Baseline latency, query count and peak memory for every view and ai_models entry point.
+
+For each dataset size a throwaway database is seeded with one user holding
+that many transactions (seed_data.seed, fixed seed). Views are requested
+through the Flask test client; generate_forecast, detect_anomalies and the
+render_* functions are called directly. Chart caches are cleared before
+every iteration so each sample does the full work.
+
+    python benchmarks/bench_suite.py [--sizes 1000,100000,1000000] [--json out.json]
+    python benchmarks/bench_suite.py --sizes 1000 --compare before.json
+
+The JSON file records the commit, so runs on different commits can be
+compared with --compare.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from sqlalchemy import event  # noqa: E402
+
+from __init__ import create_app, db  # noqa: E402
+from models import Account, User  # noqa: E402
+from chart_cache import chart_cache  # noqa: E402
+import ai_models  # noqa: E402
+import seed_data  # noqa: E402
+
+DEFAULT_SIZES = '1000,100000,1000000'
+HISTORY_DAYS = 730
+
+VIEW_URLS = [
+    ('dashboard', '/dashboard'),
+    ('reports', '/reports'),
+    ('account_history', '/accounts/{account_id}/history'),
+    ('charts', '/charts'),
+    ('expense_pie_chart', '/expense_pie_chart'),
+    ('expense_bar_chart', '/expense_bar_chart'),
+    ('expense_line_chart', '/expense_line_chart'),
+    ('merged_bar_chart', '/merged_bar_chart'),
+    ('merged_line_chart', '/merged_line_chart'),
+] + [(f'chart_image:{kind}', f'/charts/{kind}.png') for kind in ai_models.CHART_KINDS]
+
+
+class QueryCounter:
+    """Counts statements executed on the engine while active."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+
+def _percentile(samples, fraction):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def measure(run, iterations, warmup, counter):
+    """Time run() and return a result dict with p50/p95/mean (ms), queries and peak memory."""
+    for _ in range(warmup):
+        chart_cache.clear()
+        run()
+
+    samples = []
+    queries = 0
+    for _ in range(iterations):
+        chart_cache.clear()
+        counter.count = 0
+        started = time.perf_counter()
+        run()
+        samples.append(time.perf_counter() - started)
+        queries = counter.count
+
+    # tracemalloc slows allocation-heavy code, so memory is a separate pass.
+    chart_cache.clear()
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'p50_ms': round(_percentile(samples, 0.50) * 1000, 3),
+        'p95_ms': round(_percentile(samples, 0.95) * 1000, 3),
+        'mean_ms': round(statistics.fmean(samples) * 1000, 3),
+        'queries': queries,
+        'peak_kb': round(peak / 1024, 1),
+        'iterations': iterations,
+    }
+
+
+def _view_runner(client, url):
+    def run():
+        response = client.get(url)
+        if response.status_code != 200:
+            raise RuntimeError(f'{url} returned {response.status_code}')
+        response.close()
+    return run
+
+
+def _function_runners(user_id):
+    snapshot = ai_models.build_snapshot(user_id)
+    expenses = snapshot['expense_totals']
+    income = snapshot['income_totals']
+    forecast, _ = ai_models.fit_forecast(user_id, snapshot=snapshot)
+    runners = [
+        ('build_snapshot', lambda: ai_models.build_snapshot(user_id)),
+        ('generate_forecast', lambda: ai_models.generate_forecast(user_id)),
+        ('detect_anomalies', lambda: ai_models.detect_anomalies(user_id)),
+        ('render_pie_chart', lambda: ai_models.render_pie_chart(expenses)),
+        ('render_bar_chart', lambda: ai_models.render_bar_chart(expenses)),
+        ('render_line_chart', lambda: ai_models.render_line_chart(expenses)),
+        ('render_merged_bar_chart', lambda: ai_models.render_merged_bar_chart(expenses, income)),
+        ('render_merged_line_chart', lambda: ai_models.render_merged_line_chart(expenses, income)),
+        ('render_income_vs_expense_pie',
+         lambda: ai_models.render_income_vs_expense_pie(expenses, income)),
+    ]
+    if forecast is not None:
+        runners.append(('render_forecast_chart', lambda: ai_models.render_forecast_chart(forecast)))
+    return runners
+
+
+def run_size(size, iterations, warmup, only=None):
+    """Seed a fresh database with `size` transactions and benchmark everything against it."""
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    try:
+        app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}'})
+        counter = QueryCounter()
+        results = {}
+        with app.app_context():
+            started = time.perf_counter()
+            seed_data.seed(users=1, transactions=size, days=HISTORY_DAYS, log=None)
+            print(f'{size:,} transactions seeded in {time.perf_counter() - started:.1f}s')
+            user = User.query.filter_by(email=seed_data.SEED_EMAIL).one()
+            account_id = Account.query.filter_by(user_id=user.id).order_by(Account.id).first().id
+            event.listen(db.engine, 'before_cursor_execute', counter)
+
+            for name, run in _function_runners(user.id):
+                if not only or name in only:
+                    results[name] = measure(run, iterations, warmup, counter)
+                    _print_row(name, results[name])
+
+        client = app.test_client()
+        client.post('/login', data={'email': seed_data.SEED_EMAIL,
+                                    'password': seed_data.SEED_PASSWORD})
+        for name, url in VIEW_URLS:
+            if not only or name in only:
+                results[name] = measure(_view_runner(client, url.format(account_id=account_id)),
+                                        iterations, warmup, counter)
+                _print_row(name, results[name])
+
+        with app.app_context():
+            event.remove(db.engine, 'before_cursor_execute', counter)
+            db.engine.dispose()
+        return results
+    finally:
+        os.remove(path)
+
+
+def _print_row(name, result, baseline=None):
+    change = ''
+    if baseline:
+        change = f'  {result["p50_ms"] / baseline["p50_ms"]:6.2f}x p50 vs baseline'
+    print(f'  {name:30} p50 {result["p50_ms"]:9.2f} ms  p95 {result["p95_ms"]:9.2f} ms  '
+          f'{result["queries"]:3d} queries  peak {result["peak_kb"]:10,.0f} KB{change}')
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline):
+    """Print p50 ratios of report against a previous JSON report."""
+    print(f'\nCompared with {baseline.get("commit")} ({baseline.get("created")}):')
+    for size, results in report['sizes'].items():
+        old = baseline.get('sizes', {}).get(size)
+        if not old:
+            continue
+        print(f'{int(size):,} transactions')
+        for name, result in results.items():
+            if name in old:
+                _print_row(name, result, old[name])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default=DEFAULT_SIZES,
+                        help='comma separated transactions per user (default: %(default)s)')
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--only', help='comma separated benchmark names to run')
+    parser.add_argument('--json', help='write results to this file')
+    parser.add_argument('--compare', help='previous --json output to compare against')
+    args = parser.parse_args()
+
+    only = set(args.only.split(',')) if args.only else None
+    report = {
+        'commit': _commit(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'iterations': args.iterations,
+        'sizes': {},
+    }
+    for size in (int(s) for s in args.sizes.split(',')):
+        report['sizes'][str(size)] = run_size(size, args.iterations, args.warmup, only)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'Wrote {args.json}')
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+"""Concurrent readers and writers against SQLite, with and without the tuned engine setup.
+
+Writer threads post /add-expense in a loop and importer threads post
+/import files of --import-rows rows, while reader threads load /dashboard
+and /api/transactions. Each mode runs on its own fresh database file, since
+journal_mode=WAL persists in the file. The report shows latency and how
+many requests failed, e.g. with "database is locked".
+
+The imports give the readers long write transactions to contend with.
+Without WAL a reader waits while a writer commits, and a writer waits for
+every open reader, up to the busy timeout ("database is locked" after that).
+In one process these requests also share the GIL, which hides much of the
+difference in read p50/p95: what moves between the modes is the worst read,
+write latency and the failure count.
+
+    python benchmarks/stress_sqlite.py [--readers 4] [--writers 4] [--importers 1] [--seconds 10]
+"""
+import argparse
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from __init__ import create_app, db  # noqa: E402
+import seed_data  # noqa: E402
+
+READ_URLS = ('/dashboard', '/api/transactions?limit=50')
+MODES = {
+    'default': {'SQLITE_TUNING': False},
+    'tuned': {},
+}
+
+
+def _login(app, index):
+    client = app.test_client()
+    client.post('/login', data={'email': seed_data.seed_email(index),
+                                'password': seed_data.SEED_PASSWORD})
+    return client
+
+
+def _reader(app, index, deadline, results):
+    client = _login(app, index)
+    latencies, failures = [], 0
+    while time.perf_counter() < deadline:
+        for url in READ_URLS:
+            started = time.perf_counter()
+            try:
+                ok = client.get(url).status_code == 200
+            except Exception:
+                ok = False
+            latencies.append(time.perf_counter() - started)
+            failures += not ok
+    results.append(('read', latencies, failures))
+
+
+def _writer(app, index, deadline, results):
+    client = _login(app, index)
+    latencies, failures = [], 0
+    n = 0
+    while time.perf_counter() < deadline:
+        n += 1
+        started = time.perf_counter()
+        try:
+            response = client.post('/add-expense', data={
+                'amount': str(10 + n % 50), 'category': 'Food', 'type': 'Expense',
+                'description': f'stress {index}-{n}', 'paymentMode': 'Cash'})
+            ok = response.status_code == 200 and response.get_json().get('success')
+        except Exception:
+            ok = False
+        latencies.append(time.perf_counter() - started)
+        failures += not ok
+    results.append(('write', latencies, failures))
+
+
+def _importer(app, index, deadline, rows, results):
+    client = _login(app, index)
+    latencies, failures = [], 0
+    n = 0
+    while time.perf_counter() < deadline:
+        n += 1
+        body = '\n'.join(json.dumps({
+            'amount': 10 + i % 50, 'category': 'Food', 'type': 'Expense',
+            'description': f'import {index}-{n}-{i}', 'payment_mode': 'Cash'}) for i in range(rows))
+        started = time.perf_counter()
+        try:
+            response = client.post('/import', data={'file': (io.BytesIO(body.encode()), 'stress.ndjson')},
+                                   content_type='multipart/form-data')
+            ok = response.status_code == 200 and response.get_json().get('success')
+        except Exception:
+            ok = False
+        latencies.append(time.perf_counter() - started)
+        failures += not ok
+    results.append(('import', latencies, failures))
+
+
+def _summary(kind, results):
+    latencies = [s for k, samples, _ in results if k == kind for s in samples]
+    failures = sum(f for k, _, f in results if k == kind)
+    if not latencies:
+        return f'{kind:6}: no requests'
+    ordered = sorted(latencies)
+    p95 = ordered[min(len(ordered) - 1, round(0.95 * (len(ordered) - 1)))]
+    return (f'{kind:6}: {len(latencies):6,} requests  {failures:5,} failed  '
+            f'p50 {statistics.median(ordered) * 1000:8.1f} ms  p95 {p95 * 1000:8.1f} ms  '
+            f'max {ordered[-1] * 1000:8.1f} ms')
+
+
+def run(mode, readers, writers, importers, import_rows, seconds, transactions):
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    try:
+        config = {'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}', **MODES[mode]}
+        app = create_app(config)
+        with app.app_context():
+            seed_data.seed(users=readers + writers + importers, transactions=transactions, days=365, log=None)
+            journal = db.session.connection().exec_driver_sql('PRAGMA journal_mode').scalar()
+
+        results = []
+        deadline = time.perf_counter() + seconds
+        threads = [threading.Thread(target=_reader, args=(app, i, deadline, results))
+                   for i in range(readers)]
+        threads += [threading.Thread(target=_writer, args=(app, readers + i, deadline, results))
+                    for i in range(writers)]
+        threads += [threading.Thread(target=_importer,
+                                     args=(app, readers + writers + i, deadline, import_rows, results))
+                    for i in range(importers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        print(f'{mode} (journal_mode={journal}, {readers} readers, {writers} writers, '
+              f'{importers} importers, {seconds}s)')
+        for kind in ('read', 'write', 'import'):
+            print('  ' + _summary(kind, results))
+        with app.app_context():
+            db.engine.dispose()
+    finally:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--importers', type=int, default=1)
+    parser.add_argument('--import-rows', type=int, default=5000,
+                        help='rows per imported file (one transaction up to 5000)')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--transactions', type=int, default=5000,
+                        help='seeded transactions per user')
+    parser.add_argument('--mode', choices=sorted(MODES), action='append',
+                        help='run only this mode (repeatable; default: all)')
+    args = parser.parse_args()
+
+    for mode in args.mode or MODES:
+        run(mode, args.readers, args.writers, args.importers, args.import_rows,
+            args.seconds, args.transactions)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+import glob
+import os
+import threading
+from collections import OrderedDict
+
+from sqlalchemy import func
+
+from __init__ import db
+
+
+class ChartCache:
+    """Size-bounded LRU of rendered chart PNGs with an optional on-disk tier.
+
+    Keys are (user_id, kind, version) tuples. The version is the user's data
+    version (plus the day, for charts whose window ends today), so any
+    expense write makes older entries unreachable; they age out of memory
+    through the LRU and are deleted from disk when the same chart is stored
+    under a newer version.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, directory=None):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def init_app(self, app):
+        self.max_bytes = app.config.get('CHART_CACHE_MAX_BYTES', self.max_bytes)
+        self.directory = app.config.get('CHART_CACHE_DIR', self.directory)
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+        app.extensions['chart_cache'] = self
+
+    def _path(self, key):
+        user_id, kind, version = key
+        return os.path.join(self.directory, f'{user_id}-{kind}-{version}.png')
+
+    def _remember(self, key, png):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return
+            self._entries[key] = png
+            self._size += len(png)
+            while self._size > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def get(self, key):
+        with self._lock:
+            png = self._entries.get(key)
+            if png is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return png
+        if self.directory:
+            try:
+                with open(self._path(key), 'rb') as f:
+                    png = f.read()
+            except OSError:
+                png = None
+            if png is not None:
+                self._remember(key, png)
+                with self._lock:
+                    self.hits += 1
+                return png
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key, png):
+        self._remember(key, png)
+        if self.directory:
+            path = self._path(key)
+            user_id, kind, _ = key
+            for stale in glob.glob(os.path.join(self.directory, f'{user_id}-{kind}-*.png')):
+                if stale != path:
+                    try:
+                        os.remove(stale)
+                    except OSError:
+                        pass
+            tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(png)
+            os.replace(tmp_path, path)
+
+    def get_or_render(self, key, render):
+        """Return cached PNG bytes for key, calling render() only on a miss.
+
+        render() may return None when there is nothing to draw; that is not cached.
+        """
+        png = self.get(key)
+        if png is None:
+            png = render()
+            if png is not None:
+                self.set(key, png)
+        return png
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+
+chart_cache = ChartCache()
+
+
+def get_data_version(user_id):
+    """Return the counter bumped on every write to the user's transactions."""
+    from models import User
+    return db.session.query(User.data_version).filter(User.id == user_id).scalar() or 0
+
+
+def bump_data_version(user_id=None):
+    """Invalidate everything derived from the user's transactions (all users if
+    None; user_id may also be a list of ids).
+
+    Runs inside the caller's transaction, next to the Expense write.
+    """
+    from models import User
+    query = User.query
+    if isinstance(user_id, (list, tuple)):
+        query = query.filter(User.id.in_(user_id))
+    elif user_id is not None:
+        query = query.filter(User.id == user_id)
+    (query
+     .update({User.data_version: func.coalesce(User.data_version, 0) + 1},
+             synchronize_session=False))
@@ -0,0 +1,96 @@
+"""Fail if any view's query on the expense tables falls back to a table scan.
+
+Drives the main views through the Flask test client against a throwaway
+database, captures every SELECT they issue, and runs EXPLAIN QUERY PLAN on
+the ones that touch the expense, rollup and anomaly tables.
+"""
+import os
+import re
+import sys
+import tempfile
+
+from sqlalchemy import event
+
+from __init__ import create_app, db
+from models import Account
+
+CHECKED_TABLES = ('expense', 'expense_rollup', 'spending_stats', 'spending_anomaly',
+                  'spending_breakdown_anomaly', 'spending_forecast')
+TABLE_SCAN = re.compile(r'\bSCAN (%s)\b(?! USING)' % '|'.join(CHECKED_TABLES))
+
+
+def capture_queries(app, client):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT') and not executemany:
+            statements.append((statement, parameters))
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        client.post('/sign-up', data={
+            'email': 'plans@example.com', 'firstName': 'Plans',
+            'password1': 'password', 'password2': 'password',
+            'gender': 'Other', 'number': '1234567',
+        })
+        with app.app_context():
+            account = Account(name='Wallet', number='1', type='Cash', balance=0, user_id=1)
+            db.session.add(account)
+            db.session.commit()
+            account_id = account.id
+        for i in range(20):
+            client.post('/add-expense', data={
+                'amount': str(10 + i), 'category': 'Food',
+                'type': 'Expense' if i % 4 else 'Income',
+                'paymentMode': str(account_id),
+            })
+        statements.clear()
+        for url in ('/dashboard', '/reports', f'/accounts/{account_id}/history',
+                    '/charts', '/charts/merged_bar.png', '/charts/forecast.png',
+                    '/expense_pie_chart', '/merged_bar_chart'):
+            client.get(url)
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+    return statements
+
+
+def main():
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}'})
+    # Only the queries matter here; a view failing to render is not our concern.
+    app.logger.disabled = True
+    try:
+        statements = capture_queries(app, app.test_client())
+        failures = 0
+        with app.app_context():
+            seen = set()
+            for statement, parameters in statements:
+                if statement in seen or not any(t in statement for t in CHECKED_TABLES):
+                    continue
+                seen.add(statement)
+                plan = (db.session.connection()
+                        .exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters)
+                        .fetchall())
+                details = [row[-1] for row in plan]
+                scans = [d for d in details if TABLE_SCAN.search(d)]
+                status = 'FAIL' if scans else 'ok'
+                failures += bool(scans)
+                print(f"[{status}] {' '.join(statement.split())[:120]}")
+                for d in details:
+                    print(f"       {d}")
+        with app.app_context():
+            db.engine.dispose()
+    finally:
+        os.remove(path)
+
+    if failures:
+        print(f"{failures} query plan(s) use a full table scan.")
+        sys.exit(1)
+    print("All checked queries use an index.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,242 @@
+import functools
+import json
+import os
+
+from flask import g, has_app_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import Date, create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+from sqlalchemy.types import String
+
+# Applied to every new SQLite connection. WAL lets readers run while a write
+# is in progress; synchronous=NORMAL is durable across application crashes in
+# WAL mode and only fsyncs at checkpoints. cache_size is in KiB when negative.
+DEFAULT_SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'cache_size': -64000,
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+# Pool for file-backed SQLite under a threaded server. SQLite serialises
+# writers anyway, so a handful of connections is enough; overflow absorbs
+# bursts of readers and pre_ping is unnecessary for a local file.
+DEFAULT_SQLITE_POOL = {
+    'pool_size': 8,
+    'max_overflow': 16,
+    'pool_timeout': 10,
+}
+
+# Server databases drop idle connections; check and recycle them.
+DEFAULT_SERVER_POOL = {
+    'pool_size': 10,
+    'max_overflow': 20,
+    'pool_pre_ping': True,
+    'pool_recycle': 1800,
+}
+
+REPLICA_BIND = 'replica'
+INSTANCE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance')
+
+
+def _normalise_uri(uri):
+    # Hosting providers still hand out the postgres:// scheme SQLAlchemy dropped.
+    if uri.startswith('postgres://'):
+        return 'postgresql://' + uri[len('postgres://'):]
+    return uri
+
+
+def config_from_env(environ=os.environ):
+    """Read database settings from the environment.
+
+    DATABASE_URL sets the primary database, DATABASE_REPLICA_URL an optional
+    read replica, and DATABASE_ENGINE_OPTIONS a JSON object of extra
+    create_engine() arguments.
+    """
+    config = {}
+    if environ.get('DATABASE_URL'):
+        config['SQLALCHEMY_DATABASE_URI'] = _normalise_uri(environ['DATABASE_URL'])
+    if environ.get('DATABASE_REPLICA_URL'):
+        config['DATABASE_REPLICA_URI'] = _normalise_uri(environ['DATABASE_REPLICA_URL'])
+    if environ.get('DATABASE_ENGINE_OPTIONS'):
+        config['SQLALCHEMY_ENGINE_OPTIONS'] = json.loads(environ['DATABASE_ENGINE_OPTIONS'])
+    return config
+
+
+def _is_sqlite_file(uri):
+    url = make_url(uri)
+    return url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:')
+
+
+def sqlite_pragmas(app):
+    """Return the pragmas for the app: DEFAULT_SQLITE_PRAGMAS updated by SQLITE_PRAGMAS.
+
+    A pragma set to None in SQLITE_PRAGMAS is left at SQLite's default.
+    """
+    pragmas = dict(DEFAULT_SQLITE_PRAGMAS)
+    pragmas.update(app.config.get('SQLITE_PRAGMAS') or {})
+    return {name: value for name, value in pragmas.items() if value is not None}
+
+
+def configure(app):
+    """Fill in engine options and the replica bind; call before db.init_app.
+
+    Options already in SQLALCHEMY_ENGINE_OPTIONS win over the defaults.
+    Set SQLITE_TUNING to False to keep SQLAlchemy's own defaults for SQLite.
+    """
+    if app.config.get('DATABASE_REPLICA_URI'):
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        binds.setdefault(REPLICA_BIND, app.config['DATABASE_REPLICA_URI'])
+        app.config['SQLALCHEMY_BINDS'] = binds
+
+    uri = app.config['SQLALCHEMY_DATABASE_URI']
+    if make_url(uri).get_backend_name() == 'sqlite':
+        if not (app.config.get('SQLITE_TUNING', True) and _is_sqlite_file(uri)):
+            return
+        options = dict(DEFAULT_SQLITE_POOL)
+        options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+        # The driver's own lock timeout (seconds) covers the window before the
+        # busy_timeout pragma has run on a fresh connection.
+        connect_args = {'timeout': sqlite_pragmas(app).get('busy_timeout', 5000) / 1000}
+        connect_args.update(options.get('connect_args') or {})
+        options['connect_args'] = connect_args
+    else:
+        options = dict(DEFAULT_SERVER_POOL)
+        options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+
+def init_app(app):
+    """Run the configured pragmas on each new SQLite connection; call after db.init_app."""
+    if not app.config.get('SQLITE_TUNING', True):
+        return
+    from __init__ import db
+    pragmas = sqlite_pragmas(app)
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == 'sqlite':
+                event.listen(engine, 'connect', _pragma_listener(pragmas))
+
+
+def _pragma_listener(pragmas):
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f'PRAGMA {name}={value}')
+        finally:
+            cursor.close()
+    return set_pragmas
+
+
+def create_standalone_engine(default_uri):
+    """Engine for maintenance scripts that run without the app.
+
+    Uses DATABASE_URL when set, otherwise default_uri; a relative SQLite path
+    resolves against instance/ the way Flask-SQLAlchemy resolves it.
+    """
+    url = make_url(config_from_env().get('SQLALCHEMY_DATABASE_URI', default_uri))
+    if url.get_backend_name() == 'sqlite' and url.database and url.database != ':memory:':
+        if not os.path.isabs(url.database):
+            url = url.set(database=os.path.join(INSTANCE_PATH, url.database))
+    return create_engine(url)
+
+
+#  Read replica routing
+
+class RoutingSession(Session):
+    """Session that sends a read-only view's queries to the replica bind.
+
+    Only views marked with @read_only are routed, and never a flush, so
+    writes always reach the primary. Without a replica configured every
+    query uses the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_app_context() and g.get('use_replica'):
+            replica = self._db.engines.get(REPLICA_BIND)
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def read_only(view):
+    """Route the view's queries to the replica. Place below @login_required.
+
+    The current user is then still loaded from the primary. A replica can lag,
+    so only use this on views that tolerate slightly stale data.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        g.use_replica = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+#  Portable SQL expressions
+
+class day_of(FunctionElement):
+    """Calendar day of a timestamp, as a DATE (a 'YYYY-MM-DD' string on SQLite)."""
+    type = Date()
+    inherit_cache = True
+
+
+class month_of(FunctionElement):
+    """'YYYY-MM' string of a timestamp."""
+    type = String()
+    inherit_cache = True
+
+
+@compiles(day_of)
+def _day_of_default(element, compiler, **kw):
+    return f'CAST({compiler.process(element.clauses, **kw)} AS DATE)'
+
+
+@compiles(day_of, 'sqlite')
+def _day_of_sqlite(element, compiler, **kw):
+    return f'date({compiler.process(element.clauses, **kw)})'
+
+
+@compiles(month_of)
+def _month_of_default(element, compiler, **kw):
+    return f"to_char({compiler.process(element.clauses, **kw)}, 'YYYY-MM')"
+
+
+@compiles(month_of, 'sqlite')
+def _month_of_sqlite(element, compiler, **kw):
+    return f"strftime('%Y-%m', {compiler.process(element.clauses, **kw)})"
+
+
+@compiles(month_of, 'mysql')
+def _month_of_mysql(element, compiler, **kw):
+    return f"DATE_FORMAT({compiler.process(element.clauses, **kw)}, '%%Y-%%m')"
+
+
+def upsert(table, bind, index_elements, increment, replace=()):
+    """INSERT ... ON CONFLICT that adds `increment` columns to the existing row
+    and overwrites `replace` columns with the new row's values.
+
+    Returns a statement for the bind's dialect; SQLite and PostgreSQL share
+    the ON CONFLICT syntax, MySQL uses ON DUPLICATE KEY UPDATE.
+    """
+    dialect = bind.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        stmt = insert(table)
+        set_ = {name: table.c[name] + stmt.excluded[name] for name in increment}
+        set_.update((name, stmt.excluded[name]) for name in replace)
+        return stmt.on_conflict_do_update(index_elements=index_elements, set_=set_)
+    if dialect in ('mysql', 'mariadb'):
+        from sqlalchemy.dialects.mysql import insert
+        stmt = insert(table)
+        set_ = {name: table.c[name] + stmt.inserted[name] for name in increment}
+        set_.update((name, stmt.inserted[name]) for name in replace)
+        return stmt.on_duplicate_key_update(set_)
+    raise NotImplementedError(f'No upsert for the {dialect} dialect')
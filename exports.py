@@ -0,0 +1,119 @@
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+
+from flask import Blueprint, Response, abort, request, stream_with_context
+from flask_login import login_required, current_user
+from sqlalchemy import or_
+
+from models import Expense, Account
+from __init__ import db
+
+exports = Blueprint('exports', __name__)
+
+EXPORT_BATCH_SIZE = 2000
+EXPORT_COLUMNS = ('id', 'date', 'type', 'category', 'description', 'payment_mode', 'amount')
+
+
+def _parse_day(value):
+    return datetime.strptime(value, '%Y-%m-%d')
+
+
+def export_query(user_id, args):
+    """Build the column query for an export from request filters.
+
+    Supported filters: start and end (YYYY-MM-DD, inclusive), type, category
+    and account_id. Raises ValueError for malformed filters.
+    """
+    query = (db.session.query(Expense.id, Expense.date, Expense.type, Expense.category,
+                              Expense.description, Expense.payment_mode, Expense.amount)
+             .filter(Expense.user_id == user_id))
+    if args.get('start'):
+        query = query.filter(Expense.date >= _parse_day(args['start']))
+    if args.get('end'):
+        query = query.filter(Expense.date < _parse_day(args['end']) + timedelta(days=1))
+    if args.get('type'):
+        query = query.filter(Expense.type == args['type'])
+    if args.get('category'):
+        query = query.filter(Expense.category == args['category'])
+    if args.get('account_id'):
+        account = Account.query.get(int(args['account_id']))
+        if not account or account.user_id != user_id:
+            raise LookupError('Account not found')
+        query = query.filter(or_(Expense.payment_mode == str(account.id),
+                                 Expense.payment_mode == account.name))
+    return query.order_by(Expense.date, Expense.id)
+
+
+def _batches(query):
+    # Rows are read through a server-side cursor in fixed batches, so an
+    # export holds one batch in memory however large the history is.
+    result = db.session.execute(
+        query.statement,
+        execution_options={'stream_results': True, 'yield_per': EXPORT_BATCH_SIZE},
+    )
+    yield from result.partitions()
+
+
+def iter_csv(query):
+    """Yield the export as CSV text, one chunk per batch of rows."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(EXPORT_COLUMNS)
+    for rows in _batches(query):
+        writer.writerows(
+            (expense_id, date.isoformat() if date else '', expense_type,
+             category, description or '', payment_mode or '', amount)
+            for expense_id, date, expense_type, category, description, payment_mode, amount in rows
+        )
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue()
+
+
+def iter_ndjson(query):
+    """Yield the export as newline-delimited JSON, one chunk per batch of rows."""
+    dumps = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+    for rows in _batches(query):
+        yield ''.join(
+            dumps({
+                'id': expense_id,
+                'date': date.isoformat() if date else None,
+                'type': expense_type,
+                'category': category,
+                'description': description,
+                'payment_mode': payment_mode,
+                'amount': amount,
+            }) + '\n'
+            for expense_id, date, expense_type, category, description, payment_mode, amount in rows
+        )
+
+
+def _export_response(serialise, mimetype, extension):
+    try:
+        query = export_query(current_user.id, request.args)
+    except ValueError:
+        abort(400)
+    except LookupError:
+        abort(404)
+    filename = f"spendly-transactions-{datetime.now():%Y%m%d}.{extension}"
+    return Response(
+        stream_with_context(serialise(query)),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'},
+    )
+
+
+@exports.route('/export.csv')
+@login_required
+def export_csv():
+    return _export_response(iter_csv, 'text/csv', 'csv')
+
+
+@exports.route('/export.ndjson')
+@login_required
+def export_ndjson():
+    return _export_response(iter_ndjson, 'application/x-ndjson', 'ndjson')
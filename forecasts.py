@@ -0,0 +1,389 @@
+"""Incremental least-squares fit behind the spending forecast.
+
+The forecast is a straight line through the daily expense totals of the
+last WINDOW_DAYS days, days without spending counting as 0; the window
+starts no earlier than the user's first expense. Rather than refitting the
+window on every request, each user's ForecastStats row keeps the
+sufficient statistics of that fit as of its end_day: Σy, Σxy and the
+transaction count, with x in days relative to end_day. The number of days
+follows from end_day and first_day, and so do Σx and Σx². A new expense
+adds to the sums in O(1). When the window moves forward, the days that
+drop out are subtracted and x shifts in closed form.
+
+Alongside the line, precompute() fits a Holt-Winters model with a weekly
+season (holt_winters.py) for every user in one batched pass each night and
+stores it in SpendingForecast; /charts reads it instead of fitting.
+"""
+import math
+import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+from sqlalchemy import String, func, insert, select, type_coerce, union_all
+
+from __init__ import db
+from database import day_of
+import holt_winters
+from models import Expense, ForecastStats, SpendingForecast, User
+
+WINDOW_DAYS = 60
+# Days needed before a line is fitted.
+MIN_DAYS = 3
+ROLL_BATCH_SIZE = 500
+# The forecast chart is redrawn only when the line moves by more than this
+# fraction of the typical daily spend (rounded to a power of ten).
+RESOLUTION = 0.01
+# Days of history the seasonal model is fitted on: 16 full weeks.
+HW_HISTORY_DAYS = 16 * holt_winters.SEASON
+# A stored seasonal fit older than this is ignored and the line used alone.
+HW_MAX_AGE_DAYS = 7
+
+_STATE = ('first_day', 'end_day', 'sum_y', 'sum_xy', 'count')
+
+
+def _state(stats):
+    return {name: getattr(stats, name) for name in _STATE}
+
+
+def _empty(today):
+    return {'first_day': None, 'end_day': today, 'sum_y': 0.0, 'sum_xy': 0.0, 'count': 0}
+
+
+def _window_start(state):
+    return max(state['end_day'] - timedelta(days=WINDOW_DAYS - 1), state['first_day'])
+
+
+def _midnight(day):
+    return datetime.combine(day, datetime.min.time())
+
+
+def _daily(user_ids, ranges, exclude_id=None):
+    """(user_id, day, total, count) per user and day, for days in any of the
+    inclusive (first, last) date ranges. Runs as one query.
+    """
+    day = type_coerce(day_of(Expense.date), String)
+    selects = []
+    for first, last in ranges:
+        query = (select(Expense.user_id, day, func.sum(Expense.amount), func.count(Expense.id))
+                 .where(Expense.user_id.in_(user_ids),
+                        Expense.type == 'Expense',
+                        Expense.date >= _midnight(first),
+                        Expense.date < _midnight(last + timedelta(days=1)))
+                 .group_by(Expense.user_id, day))
+        if exclude_id is not None:
+            query = query.where(Expense.id != exclude_id)
+        selects.append(query)
+    statement = selects[0] if len(selects) == 1 else union_all(*selects)
+    return [(user_id, date.fromisoformat(str(day)), float(total or 0), int(count))
+            for user_id, day, total, count in db.session.execute(statement)]
+
+
+def _first_days(user_ids):
+    """{user_id: day of the first expense}, for users who have one."""
+    firsts = (db.session.query(Expense.user_id, func.min(Expense.date))
+              .filter(Expense.user_id.in_(user_ids), Expense.type == 'Expense')
+              .group_by(Expense.user_id))
+    return {user_id: first.date() for user_id, first in firsts}
+
+
+def _compute(user_ids, today):
+    """Sufficient statistics from scratch, as of today: {user_id: state}."""
+    states = {user_id: _empty(today) for user_id in user_ids}
+    for user_id, first in _first_days(user_ids).items():
+        states[user_id]['first_day'] = first
+    for user_id, day, total, count in _daily(user_ids, [(today - timedelta(days=WINDOW_DAYS - 1), today)]):
+        state = states[user_id]
+        state['sum_y'] += total
+        state['sum_xy'] += (day - today).days * total
+        state['count'] += count
+    return states
+
+
+def _advance(states, today, exclude_id=None):
+    """Move each state's window forward so it ends on today, in place.
+
+    One query fetches the days leaving the windows and any already-written
+    days entering them (normally none). exclude_id leaves out an expense
+    the caller is about to add itself.
+    """
+    stale = {user_id: s for user_id, s in states.items() if s['end_day'] < today}
+    if not stale:
+        return
+    ranges = []
+    oldest_end = min(s['end_day'] for s in stale.values())
+    if any(s['first_day'] is not None for s in stale.values()):
+        # Stops at oldest_end so the two ranges never overlap.
+        ranges.append((oldest_end - timedelta(days=WINDOW_DAYS - 1),
+                       min(today - timedelta(days=WINDOW_DAYS), oldest_end)))
+    ranges.append((oldest_end + timedelta(days=1), today))
+    new_start = today - timedelta(days=WINDOW_DAYS - 1)
+    entering = []
+    for user_id, day, total, count in _daily(list(stale), ranges, exclude_id):
+        state = stale[user_id]
+        if day > state['end_day']:
+            # A window that ended WINDOW_DAYS or more ago skips some days entirely.
+            if state['first_day'] is None or day < state['first_day']:
+                state['first_day'] = day
+            if day >= new_start:
+                entering.append((state, day, total, count))
+        elif day < new_start and day >= _window_start(state):
+            state['sum_y'] -= total
+            state['sum_xy'] -= (day - state['end_day']).days * total
+            state['count'] -= count
+    for state in stale.values():
+        shift = (today - state['end_day']).days
+        state['sum_xy'] -= shift * state['sum_y']
+        state['end_day'] = today
+    for state, day, total, count in entering:
+        state['sum_y'] += total
+        state['sum_xy'] += (day - today).days * total
+        state['count'] += count
+
+
+def fit(state):
+    """Solve the least-squares line from a state.
+
+    Returns a dict with start, end, days, count, sum_y, and slope and level
+    (the line's value on the end day); slope and level are None with fewer
+    than MIN_DAYS days.
+    """
+    n = 0
+    start = None
+    if state['first_day'] is not None and state['first_day'] <= state['end_day']:
+        start = _window_start(state)
+        n = (state['end_day'] - start).days + 1
+    result = {'start': start, 'end': state['end_day'], 'days': n, 'count': state['count'],
+              'sum_y': state['sum_y'], 'slope': None, 'level': None}
+    if n >= MIN_DAYS:
+        # x runs from -(n - 1) to 0.
+        sum_x = -n * (n - 1) / 2
+        sum_xx = (n - 1) * n * (2 * n - 1) / 6
+        slope = (n * state['sum_xy'] - sum_x * state['sum_y']) / (n * sum_xx - sum_x * sum_x)
+        result['slope'] = slope
+        result['level'] = (state['sum_y'] - slope * sum_x) / n
+    return result
+
+
+def current(user_id, today=None):
+    """Return fit() for the window ending today.
+
+    Reads the stored statistics, and only queries Expense for the days that
+    left the window since they were last moved, or for all of it when the
+    user has none stored yet. Nothing is written, so this is safe on a replica.
+    """
+    today = today or date.today()
+    stats = db.session.get(ForecastStats, user_id)
+    if stats is None:
+        state = _compute([user_id], today)[user_id]
+    else:
+        state = _state(stats)
+        _advance({user_id: state}, today)
+    return fit(state)
+
+
+def check_consistency(user_id=None, today=None):
+    """Compare stored statistics moved to today with a recompute (all users, or one user).
+
+    Users without stored statistics are skipped; current() computes theirs.
+    Returns a list of mismatch dicts; an empty list means the incremental
+    updates agree with _compute.
+    """
+    today = today or date.today()
+    query = ForecastStats.query
+    if user_id is not None:
+        query = query.filter(ForecastStats.user_id == user_id)
+    states = {s.user_id: _state(s) for s in query}
+    mismatches = []
+    for start in range(0, len(states), ROLL_BATCH_SIZE):
+        batch = {user_id: states[user_id] for user_id in list(states)[start:start + ROLL_BATCH_SIZE]}
+        _advance(batch, today)
+        expected = _compute(list(batch), today)
+        for user_id, have in batch.items():
+            want = expected[user_id]
+            if ((have['first_day'], have['count']) != (want['first_day'], want['count'])
+                    or any(not math.isclose(have[name], want[name], rel_tol=1e-6, abs_tol=0.005)
+                           for name in ('sum_y', 'sum_xy'))):
+                mismatches.append({'user_id': user_id, 'expected': want, 'stored': have})
+    return mismatches
+
+
+def signature(result):
+    """Short string that only changes when the fitted line visibly moves.
+
+    Keys the rendered forecast chart, so an expense that leaves the line
+    where it was does not redraw it.
+    """
+    if result['slope'] is None:
+        return f"none-{result['end']}-{result['days']}"
+    n = result['days']
+    scale = max(abs(result['sum_y']) / n, 1.0)
+    step = 10 ** math.floor(math.log10(scale)) * RESOLUTION
+    # The line's ends: its value at the window start and on the end day.
+    start_value = result['level'] - result['slope'] * (n - 1)
+    return f"{result['end']}-{n}-{round(start_value / step)}-{round(result['level'] / step)}"
+
+
+def _store(states):
+    stored = {stats.user_id: stats for stats in
+              ForecastStats.query.filter(ForecastStats.user_id.in_(list(states)))}
+    for user_id, state in states.items():
+        stats = stored.get(user_id)
+        if stats is None:
+            db.session.add(ForecastStats(user_id=user_id, **state))
+        else:
+            for name, value in state.items():
+                setattr(stats, name, value)
+
+
+def record_expense(expense, sign=1):
+    """Add (sign=1) or remove (sign=-1) one flushed expense from the user's statistics.
+
+    Runs inside the caller's transaction, and moves the window to today on
+    the way. An expense before the user's first day, or removing one on it,
+    recomputes the user instead.
+    """
+    if expense.type != 'Expense':
+        return
+    today = date.today()
+    day = expense.date.date()
+    stats = db.session.get(ForecastStats, expense.user_id, with_for_update=True)
+    if (stats is None or stats.first_day is None or day < stats.first_day
+            or (sign < 0 and day == stats.first_day)):
+        _store(_compute([expense.user_id], today))
+        return
+
+    state = {expense.user_id: _state(stats)}
+    today = max(today, stats.end_day)
+    # A new row is added to the moved window; a deleted one is already gone
+    # from the table, so it is taken out of the window it was counted in.
+    if sign > 0:
+        _advance(state, today, exclude_id=expense.id)
+    window = state[expense.user_id]
+    if _window_start(window) <= day <= window['end_day']:
+        amount = expense.amount * sign
+        window['sum_y'] += amount
+        window['sum_xy'] += (day - window['end_day']).days * amount
+        window['count'] += sign
+    if sign < 0:
+        _advance(state, today)
+    _store(state)
+
+
+def _in_batches(work, user_id, batch_size, log):
+    if isinstance(user_id, (list, tuple)):
+        user_ids = list(user_id)
+    elif user_id is not None:
+        user_ids = [user_id]
+    else:
+        user_ids = [row[0] for row in db.session.query(User.id).order_by(User.id)]
+    started = time.perf_counter()
+    for start in range(0, len(user_ids), batch_size):
+        work(user_ids[start:start + batch_size])
+        db.session.commit()
+        if log:
+            done = min(start + batch_size, len(user_ids))
+            log(f"  {done}/{len(user_ids)} users ({done / (time.perf_counter() - started):,.0f} users/s)")
+    return len(user_ids)
+
+
+def rebuild(user_id=None, batch_size=ROLL_BATCH_SIZE, log=None):
+    """Recompute the statistics from Expense (all users, one user or a list of users).
+
+    Returns users processed.
+    """
+    today = date.today()
+    return _in_batches(lambda user_ids: _store(_compute(user_ids, today)),
+                       user_id, batch_size, log)
+
+
+def roll(user_id=None, batch_size=ROLL_BATCH_SIZE, log=None):
+    """Move stored windows forward to today (all users, one user or a list of users).
+
+    Run after midnight so /charts finds every window current and needs no
+    query at all. Users without stored statistics are computed from scratch.
+    Returns users processed.
+    """
+    today = date.today()
+
+    def work(user_ids):
+        stored = {s.user_id: s for s in
+                  ForecastStats.query.filter(ForecastStats.user_id.in_(user_ids))}
+        states = {user_id: _state(s) for user_id, s in stored.items()}
+        _advance(states, today)
+        missing = [user_id for user_id in user_ids if user_id not in stored]
+        if missing:
+            states.update(_compute(missing, today))
+        _store(states)
+
+    return _in_batches(work, user_id, batch_size, log)
+
+
+def _fit_seasonal(user_ids, through):
+    """Fit holt_winters to the last HW_HISTORY_DAYS days through `through`.
+
+    Each user's series starts on their first expense, or on the first day of
+    the history if that is earlier; days without spending count as 0.
+    Returns SpendingForecast rows as dicts, for the users that could be fitted.
+    """
+    first = through - timedelta(days=HW_HISTORY_DAYS - 1)
+    column = {user_id: i for i, user_id in enumerate(user_ids)}
+    starts = np.full(len(user_ids), HW_HISTORY_DAYS)
+    for user_id, day in _first_days(user_ids).items():
+        starts[column[user_id]] = max((day - first).days, 0)
+    rows = _daily(user_ids, [(first, through)])
+    y = np.zeros((HW_HISTORY_DAYS, len(user_ids)))
+    if rows:
+        users, days, totals, _ = zip(*rows)
+        y[[(day - first).days for day in days], [column[user_id] for user_id in users]] = totals
+
+    result = holt_winters.fit(y, starts, first.weekday())
+    fitted = []
+    for user_id in user_ids:
+        i = column[user_id]
+        if result['fitted'][i]:
+            fitted.append({
+                'user_id': user_id, 'through': through,
+                'level': float(result['level'][i]), 'trend': float(result['trend'][i]),
+                'season': [round(float(v), 4) for v in result['season'][i]],
+                'alpha': float(result['alpha'][i]), 'beta': float(result['beta'][i]),
+                'gamma': float(result['gamma'][i]), 'rmse': float(result['rmse'][i]),
+            })
+    return fitted
+
+
+def precompute(user_id=None, batch_size=ROLL_BATCH_SIZE, log=None):
+    """Fit the seasonal model through yesterday (all users, one user or a list of users).
+
+    The nightly job: today is still incomplete, so it is left out. Each
+    batch of users is fitted as one array. Returns users processed.
+    """
+    through = date.today() - timedelta(days=1)
+
+    def work(user_ids):
+        fitted = _fit_seasonal(user_ids, through)
+        (SpendingForecast.query.filter(SpendingForecast.user_id.in_(user_ids))
+         .delete(synchronize_session=False))
+        if fitted:
+            db.session.execute(insert(SpendingForecast), fitted)
+
+    return _in_batches(work, user_id, batch_size, log)
+
+
+def seasonal(user_id, days=7, today=None):
+    """Read the stored seasonal forecast for the `days` days after today.
+
+    Returns a dict with values (one per day), weekday_offsets (Monday
+    first), through and rmse, or None when there is no fit or it is older
+    than HW_MAX_AGE_DAYS. Reads one row; safe on a replica.
+    """
+    today = today or date.today()
+    stored = db.session.get(SpendingForecast, user_id)
+    if stored is None or (today - stored.through).days > HW_MAX_AGE_DAYS:
+        return None
+    values = []
+    for offset in range(1, days + 1):
+        day = today + timedelta(days=offset)
+        h = (day - stored.through).days
+        values.append(stored.level + h * stored.trend + stored.season[day.weekday()])
+    return {'values': values, 'weekday_offsets': list(stored.season),
+            'through': stored.through, 'rmse': stored.rmse}
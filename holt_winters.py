@@ -0,0 +1,100 @@
+"""Additive Holt-Winters smoothing with a weekly season, for many series at once.
+
+Each series is a column of daily totals. The model tracks a level, a trend
+and one seasonal offset per weekday:
+
+    level[t]  = alpha * (y[t] - season[w]) + (1 - alpha) * (level + trend)
+    trend[t]  = beta * (level[t] - level) + (1 - beta) * trend
+    season[w] = gamma * (y[t] - level[t]) + (1 - gamma) * season[w]
+
+where w is the weekday of day t, and forecasts level + h * trend + season.
+Every series is run with every parameter combination in GRID side by side;
+each keeps the combination with the smallest one-step-ahead squared error.
+The loop runs over days only. Series and parameter combinations are the
+columns of one array, so fitting a batch of users costs one pass.
+"""
+import itertools
+
+import numpy as np
+
+SEASON = 7
+ALPHAS = (0.1, 0.3, 0.5)
+BETAS = (0.01, 0.1)
+GAMMAS = (0.05, 0.2, 0.4)
+GRID = np.array(list(itertools.product(ALPHAS, BETAS, GAMMAS)))
+
+
+def fit(y, starts, first_weekday, horizon=7, grid=GRID):
+    """Fit every column of y and forecast `horizon` days past its last row.
+
+    y is a (days, series) array on a shared calendar whose row 0 falls on
+    first_weekday (0 is Monday); series i starts at row starts[i] and needs
+    two full weeks from there. The first week sets the level and seasonal
+    offsets, the second the trend. Returns a dict of per-series arrays:
+    fitted (bool), forecast (series, horizon), level, trend,
+    season (series, 7, indexed by weekday), alpha, beta, gamma and rmse
+    (one-step-ahead error). Unfitted series have NaN values.
+    """
+    n_days, n_series = y.shape
+    if n_days < 2 * SEASON:
+        raise ValueError('Holt-Winters needs at least two weeks of days')
+    n_grid = len(grid)
+    starts = np.asarray(starts)
+    fitted = starts + 2 * SEASON <= n_days
+
+    # Column i * n_grid + k runs series i with parameter combination k.
+    columns = n_series * n_grid
+    values = np.repeat(y, n_grid, axis=1)
+    alpha, beta, gamma = (np.tile(grid[:, k], n_series) for k in range(3))
+    start = np.repeat(np.where(fitted, starts, 0), n_grid)
+
+    days = start[:, None] + np.arange(2 * SEASON)
+    first_two = values[days, np.arange(columns)[:, None]]
+    level = first_two[:, :SEASON].mean(axis=1)
+    trend = (first_two[:, SEASON:].mean(axis=1) - level) / SEASON
+    season = np.zeros((columns, SEASON))
+    np.put_along_axis(season, (first_weekday + days[:, :SEASON]) % SEASON,
+                      first_two[:, :SEASON] - level[:, None], axis=1)
+    # The level and trend describe the middle of the first week; carry them to its end.
+    level = level + trend * (SEASON - 1) / 2
+
+    sse = np.zeros(columns)
+    steps = np.zeros(columns)
+    for t in range(int(start.min()) + SEASON, n_days):
+        active = start + SEASON <= t
+        w = (first_weekday + t) % SEASON
+        x = values[t]
+        previous = season[:, w].copy()
+        error = x - (level + trend + previous)
+        sse += np.where(active, error * error, 0.0)
+        steps += active
+        new_level = alpha * (x - previous) + (1 - alpha) * (level + trend)
+        new_trend = beta * (new_level - level) + (1 - beta) * trend
+        season[:, w] = np.where(active, gamma * (x - new_level) + (1 - gamma) * previous, previous)
+        level = np.where(active, new_level, level)
+        trend = np.where(active, new_trend, trend)
+
+    # Keep each series' best parameter combination.
+    best = np.argmin(sse.reshape(n_series, n_grid), axis=1) + np.arange(n_series) * n_grid
+    level, trend, season = level[best], trend[best], season[best]
+    h = np.arange(1, horizon + 1)
+    forecast = (level[:, None] + trend[:, None] * h
+                + season[:, (first_weekday + n_days - 1 + h) % SEASON])
+
+    result = {
+        'fitted': fitted,
+        'forecast': forecast,
+        'level': level,
+        'trend': trend,
+        'season': season,
+        'alpha': alpha[best],
+        'beta': beta[best],
+        'gamma': gamma[best],
+        'rmse': np.sqrt(sse[best] / np.maximum(steps[best], 1)),
+    }
+    for name, array in result.items():
+        if name != 'fitted':
+            array = array.astype(float)
+            array[~fitted] = np.nan
+            result[name] = array
+    return result
@@ -0,0 +1,41 @@
+import argparse
+import sys
+import time
+
+from __init__ import create_app
+from jobs import job_queue
+from models import User
+import imports
+
+parser = argparse.ArgumentParser(description='Bulk import transactions from a CSV or NDJSON file.')
+parser.add_argument('email', help='email of the user who owns the transactions')
+parser.add_argument('path', help='file to import; columns match /export.csv')
+parser.add_argument('--format', choices=sorted(imports.READERS),
+                    help='file format (default: from the file extension)')
+parser.add_argument('--chunk-size', type=int, default=imports.IMPORT_CHUNK_SIZE)
+args = parser.parse_args()
+
+fmt = args.format or args.path.rsplit('.', 1)[-1].lower()
+if fmt not in imports.READERS:
+    sys.exit(f"Cannot tell the format of {args.path}; pass --format.")
+
+app = create_app()
+
+with app.app_context():
+    user = User.query.filter_by(email=args.email).first()
+    if not user:
+        sys.exit(f"No user with email {args.email}.")
+
+    started = time.perf_counter()
+    with open(args.path, encoding='utf-8-sig', newline='') as f:
+        result = imports.import_file(user.id, f, fmt, args.chunk_size)
+    # Recompute the user's analytics here rather than waiting for a worker.
+    job_queue.run_pending(user.id)
+    elapsed = time.perf_counter() - started
+
+    for error in result['errors']:
+        print(f"row {error['row']}: {error['error']}")
+    if result['error_count'] > len(result['errors']):
+        print(f"... and {result['error_count'] - len(result['errors'])} more errors")
+    print(f"Imported {result['imported']} transaction(s) in {elapsed:.1f}s, "
+          f"skipped {result['error_count']}.")
@@ -0,0 +1,155 @@
+import csv
+import io
+import json
+from datetime import datetime, timezone
+
+from flask import Blueprint, request, jsonify
+from flask_login import login_required, current_user
+from sqlalchemy import insert
+
+from models import Expense
+from __init__ import db
+from chart_cache import bump_data_version
+from jobs import job_queue
+import rollups
+from views import validate_expense_fields
+
+imports = Blueprint('imports', __name__)
+
+IMPORT_CHUNK_SIZE = 5000
+# Per-row errors beyond this are counted but not returned.
+MAX_REPORTED_ERRORS = 100
+
+
+def read_csv(stream):
+    """Yield one dict per CSV row; columns match the /export.csv header."""
+    yield from csv.DictReader(stream)
+
+
+def read_ndjson(stream):
+    """Yield one dict per line; a line that is not a JSON object yields its error string."""
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield f'Invalid JSON: {e}'
+            continue
+        yield row if isinstance(row, dict) else 'Each line must be a JSON object'
+
+
+READERS = {'csv': read_csv, 'ndjson': read_ndjson}
+
+
+def _parse_date(value):
+    if not value:
+        # Same clock as Expense.date's func.now() default, which is UTC.
+        return datetime.now(timezone.utc).replace(tzinfo=None)
+    return datetime.fromisoformat(str(value))
+
+
+def _to_values(user_id, row):
+    """Validate one imported row; return (values for insert, None) or (None, error)."""
+    if isinstance(row, str):
+        return None, row
+    amount, error = validate_expense_fields(row.get('amount'), row.get('category'), row.get('type'))
+    if error:
+        return None, error
+    try:
+        date = _parse_date(row.get('date'))
+    except ValueError:
+        return None, 'Invalid date!'
+    return {
+        'amount': amount,
+        'category': row['category'],
+        'type': row['type'],
+        'description': row.get('description') or None,
+        'payment_mode': row.get('payment_mode') or row.get('paymentMode') or None,
+        'date': date,
+        'user_id': user_id,
+    }, None
+
+
+def import_rows(user_id, rows, chunk_size=IMPORT_CHUNK_SIZE):
+    """Validate and insert transactions in batches, one transaction per chunk.
+
+    Rows that fail validation are skipped and reported by 1-based row number.
+    The rollup and the user's data version are updated once, after the last
+    chunk (or after the last committed chunk if a later one fails).
+    Returns {'imported': n, 'error_count': n, 'errors': [{'row', 'error'}]}.
+    """
+    imported = 0
+    errors = []
+    error_count = 0
+    buckets = {}
+    chunk = []
+
+    def flush():
+        nonlocal imported
+        db.session.execute(insert(Expense), chunk)
+        db.session.commit()
+        for values in chunk:
+            rollups.add_to_buckets(buckets, values['type'], values['category'],
+                                   values['date'], values['amount'])
+        imported += len(chunk)
+        chunk.clear()
+
+    try:
+        for number, row in enumerate(rows, start=1):
+            values, error = _to_values(user_id, row)
+            if error:
+                error_count += 1
+                if len(errors) < MAX_REPORTED_ERRORS:
+                    errors.append({'row': number, 'error': error})
+                continue
+            chunk.append(values)
+            if len(chunk) >= chunk_size:
+                flush()
+        if chunk:
+            flush()
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        if buckets:
+            rollups.apply_buckets(user_id, buckets)
+            bump_data_version(user_id)
+            # Imported rows can land anywhere in the history; the job rescores it once.
+            job_queue.enqueue(user_id)
+            db.session.commit()
+
+    return {'imported': imported, 'error_count': error_count, 'errors': errors}
+
+
+def import_file(user_id, stream, fmt, chunk_size=IMPORT_CHUNK_SIZE):
+    """Import a text stream in the given format ('csv' or 'ndjson')."""
+    return import_rows(user_id, READERS[fmt](stream), chunk_size)
+
+
+def _detect_format(filename):
+    fmt = request.form.get('format') or request.args.get('format')
+    if not fmt and filename:
+        fmt = filename.rsplit('.', 1)[-1].lower()
+    if fmt == 'json':
+        fmt = 'ndjson'
+    return fmt
+
+
+@imports.route('/import', methods=['POST'])
+@login_required
+def import_transactions():
+    upload = request.files.get('file')
+    if upload is None:
+        return jsonify({'success': False, 'error': 'Please attach a CSV or NDJSON file.'}), 400
+    fmt = _detect_format(upload.filename)
+    if fmt not in READERS:
+        return jsonify({'success': False, 'error': 'File must be CSV or NDJSON.'}), 400
+
+    stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+    try:
+        result = import_file(current_user.id, stream, fmt)
+    except UnicodeDecodeError:
+        return jsonify({'success': False, 'error': 'File must be UTF-8 text.'}), 400
+    return jsonify({'success': True, **result})
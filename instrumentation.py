@@ -0,0 +1,230 @@
+import functools
+import threading
+import time
+from collections import defaultdict
+
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+
+# Kept free of app and database imports: ai_models imports this module for
+# @timed, and ai_models is also loaded by chart render worker processes.
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SLOWEST_STATEMENTS = 3
+
+METRICS = {
+    'spendly_http_requests_total': ('counter', 'HTTP requests by endpoint, method and status.'),
+    'spendly_http_request_duration_seconds': ('histogram', 'HTTP request wall time.'),
+    'spendly_sql_queries_total': ('counter', 'SQL statements executed, by endpoint.'),
+    'spendly_sql_duration_seconds_total': ('counter', 'Time spent executing SQL, by endpoint.'),
+    'spendly_sql_slow_queries_total': ('counter', 'SQL statements slower than SLOW_QUERY_MS.'),
+    'spendly_function_duration_seconds': ('histogram', 'Time spent inside ai_models functions.'),
+    'spendly_chart_cache_hits_total': ('counter', 'Chart cache lookups that found a PNG.'),
+    'spendly_chart_cache_misses_total': ('counter', 'Chart cache lookups that had to render.'),
+    'spendly_jobs_total': ('counter', 'Analytics jobs run, by outcome.'),
+    'spendly_job_duration_seconds': ('histogram', 'Time spent running one analytics job.'),
+    'spendly_job_writes_coalesced_total': ('counter', 'Writes folded into an already pending job.'),
+}
+
+
+class Metrics:
+    """In-process counters and histograms rendered in Prometheus text format."""
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)
+        self._histograms = {}
+
+    def inc(self, name, labels=(), value=1):
+        with self._lock:
+            self._counters[name, labels] += value
+
+    def observe(self, name, labels, seconds):
+        with self._lock:
+            histogram = self._histograms.get((name, labels))
+            if histogram is None:
+                histogram = self._histograms[name, labels] = [[0] * len(self.buckets), 0.0, 0]
+            counts = histogram[0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    counts[i] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+
+    def clear(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def render(self, extra=()):
+        """Return every metric as Prometheus exposition text; extra is (name, labels, value)."""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: (list(h[0]), h[1], h[2]) for key, h in self._histograms.items()}
+        for name, labels, value in extra:
+            counters[name, labels] = value
+
+        lines = []
+        for name, (kind, description) in METRICS.items():
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} {kind}')
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f'{name}{_labels(labels)} {value:g}')
+            for (metric, labels), (counts, total, count) in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f'{name}_bucket{_labels(labels + (("le", f"{bound:g}"),))} {bucket_count}')
+                lines.append(f'{name}_bucket{_labels(labels + (("le", "+Inf"),))} {count}')
+                lines.append(f'{name}_sum{_labels(labels)} {total:.6f}')
+                lines.append(f'{name}_count{_labels(labels)} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+metrics = Metrics()
+_enabled = False
+
+
+def timed(func):
+    """Record the wall time of an ai_models function when instrumentation is on.
+
+    Each call is observed in spendly_function_duration_seconds and, inside a
+    request, added to that request's Server-Timing header.
+    """
+    name = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _enabled:
+            return func(*args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics.observe('spendly_function_duration_seconds', (('function', name),), elapsed)
+            if has_request_context():
+                timings = g.setdefault('function_timings', {})
+                timings[name] = timings.get(name, 0.0) + elapsed
+
+    return wrapper
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        g.query_count = g.get('query_count', 0) + 1
+
+
+def _start_statement_timer(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if not has_request_context():
+        return
+    started = conn.info.get('query_started')
+    if not started:
+        return
+    elapsed = time.perf_counter() - started.pop()
+    g.sql_time = g.get('sql_time', 0.0) + elapsed
+    slowest = g.setdefault('slowest_statements', [])
+    slowest.append((elapsed, statement))
+    slowest.sort(key=lambda item: item[0], reverse=True)
+    del slowest[SLOWEST_STATEMENTS:]
+    if elapsed * 1000 >= g.get('slow_query_ms', float('inf')):
+        g.slow_queries = g.get('slow_queries', 0) + 1
+
+
+def _server_timing(total, sql_time, count, function_timings):
+    entries = [f'total;dur={total * 1000:.1f}',
+               f'db;dur={sql_time * 1000:.1f};desc="{count} queries"']
+    entries.extend(f'{name};dur={elapsed * 1000:.1f}'
+                   for name, elapsed in sorted(function_timings.items(), key=lambda item: -item[1]))
+    return ', '.join(entries)
+
+
+def init_app(app):
+    """Count and time SQL statements and ai_models calls per request.
+
+    QUERY_COUNT_HEADER adds an X-Query-Count header to every response.
+    INSTRUMENTATION additionally times statements and @timed functions,
+    reports them in a Server-Timing header, logs the slowest statements
+    (at warning level past SLOW_QUERY_MS) and serves /metrics in
+    Prometheus text format.
+    """
+    global _enabled
+    enabled = bool(app.config.get('INSTRUMENTATION'))
+    if not (enabled or app.config.get('QUERY_COUNT_HEADER')):
+        return
+    _enabled = _enabled or enabled
+    slow_query_ms = app.config.get('SLOW_QUERY_MS', 100)
+
+    from __init__ import db
+    with app.app_context():
+        # Every bind, so reads routed to the replica are counted too.
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+            if enabled:
+                event.listen(engine, 'before_cursor_execute', _start_statement_timer)
+                event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+        g.slow_query_ms = slow_query_ms
+
+    @app.after_request
+    def report_request(response):
+        count = g.get('query_count', 0)
+        elapsed = time.perf_counter() - g.get('request_started', time.perf_counter())
+        response.headers['X-Query-Count'] = str(count)
+        if not enabled:
+            app.logger.debug('%s %s: %d queries in %.1f ms',
+                             request.method, request.path, count, elapsed * 1000)
+            return response
+
+        sql_time = g.get('sql_time', 0.0)
+        function_timings = g.get('function_timings', {})
+        response.headers['Server-Timing'] = _server_timing(elapsed, sql_time, count, function_timings)
+
+        endpoint = request.endpoint or 'unmatched'
+        metrics.inc('spendly_http_requests_total', (('endpoint', endpoint), ('method', request.method),
+                                                    ('status', str(response.status_code))))
+        metrics.observe('spendly_http_request_duration_seconds', (('endpoint', endpoint),), elapsed)
+        metrics.inc('spendly_sql_queries_total', (('endpoint', endpoint),), count)
+        metrics.inc('spendly_sql_duration_seconds_total', (('endpoint', endpoint),), sql_time)
+        if g.get('slow_queries'):
+            metrics.inc('spendly_sql_slow_queries_total', (('endpoint', endpoint),), g.slow_queries)
+
+        slowest = g.get('slowest_statements', [])
+        app.logger.debug('%s %s: %d queries (%.1f ms SQL) in %.1f ms', request.method, request.path,
+                         count, sql_time * 1000, elapsed * 1000)
+        for statement_time, statement in slowest:
+            level = app.logger.warning if statement_time * 1000 >= slow_query_ms else app.logger.debug
+            level('  %.1f ms: %s', statement_time * 1000, ' '.join(statement.split()))
+        return response
+
+    if enabled:
+        app.add_url_rule('/metrics', 'metrics', _metrics_view)
+
+
+def _metrics_view():
+    from chart_cache import chart_cache
+    text = metrics.render(extra=[
+        ('spendly_chart_cache_hits_total', (), chart_cache.hits),
+        ('spendly_chart_cache_misses_total', (), chart_cache.misses),
+    ])
+    return Response(text, mimetype='text/plain; version=0.0.4')
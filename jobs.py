@@ -0,0 +1,206 @@
+"""Local job queue that recomputes a user's analytics after their data changes.
+
+Writers call job_queue.enqueue(user_id) inside their transaction. The queue is
+the analytics_job table in the app database (SQLite by default), so there is
+no broker and a job exists exactly when the write that asked for it
+committed. There is at most one row per user: enqueueing while a job is
+pending only bumps its request count and moves it JOB_DELAY seconds past
+the latest write, so a burst of add_expense calls is handled by one run.
+
+Workers are threads: JOB_WORKERS of them in the served web app, started on
+its first request (main.py turns them on; scripts, benchmarks and test
+clients run none), or any number in a separate process (run_jobs.py). A
+worker claims a due job with a conditional UPDATE, so workers in several
+processes can share the table. A job re-runs the per-user work the request path
+leaves out (see refresh), and renders the /charts images into the chart
+cache so the page only reads results.
+"""
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, delete, or_, select, update
+
+from __init__ import db
+from database import upsert
+from instrumentation import metrics
+from models import AnalyticsJob
+import anomalies
+import forecasts
+
+log = logging.getLogger(__name__)
+
+# A failing job is retried after RETRY_DELAY seconds, and left in the table
+# for inspection after MAX_ATTEMPTS. A new write to the user resets it.
+MAX_ATTEMPTS = 3
+RETRY_DELAY = 60
+
+
+def refresh(user_id):
+    """Recompute everything derived from one user's transactions and pre-render their charts.
+
+    Rescores the daily and per category / account anomalies and refits the
+    forecast line and its weekly pattern from Expense, so imported or
+    backdated rows are covered as well as new ones.
+    """
+    from chart_cache import bump_data_version
+    from views import prerender_charts
+    anomalies.rebuild(user_id)
+    anomalies.rebuild_breakdowns(user_id)
+    forecasts.rebuild(user_id)
+    forecasts.precompute(user_id)
+    # Cached chart data includes the scores just written.
+    bump_data_version(user_id)
+    db.session.commit()
+    prerender_charts(user_id)
+
+
+def _upsert():
+    return upsert(AnalyticsJob.__table__, db.session.get_bind(mapper=AnalyticsJob),
+                  index_elements=['user_id'], increment=['requests'],
+                  replace=['attempts', 'run_after'])
+
+
+class JobQueue:
+    """Per-user analytics jobs in the database, run by a pool of worker threads.
+
+    With JOB_WORKERS at 0 (the default) the app runs none, and jobs wait for
+    run_jobs.py (or run_pending) to pick them up.
+    """
+
+    def __init__(self, workers=0, delay=2.0, poll_interval=1.0, timeout=300):
+        self.workers = workers
+        self.delay = delay
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.app = None
+        self._threads = []
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.workers = app.config.get('JOB_WORKERS', self.workers)
+        self.delay = app.config.get('JOB_DELAY', self.delay)
+        self.poll_interval = app.config.get('JOB_POLL_INTERVAL', self.poll_interval)
+        self.timeout = app.config.get('JOB_TIMEOUT', self.timeout)
+        self.app = app
+        app.extensions['job_queue'] = self
+        app.before_request(self._start_workers)
+
+    def enqueue(self, user_id):
+        """Ask for the user's analytics to be recomputed. Runs inside the caller's transaction."""
+        db.session.execute(_upsert().values(
+            user_id=user_id, requests=1, attempts=0,
+            run_after=datetime.now() + timedelta(seconds=self.delay)))
+
+    def _claimable(self, now):
+        return and_(or_(AnalyticsJob.claimed_at.is_(None),
+                        AnalyticsJob.claimed_at < now - timedelta(seconds=self.timeout)),
+                    AnalyticsJob.attempts < MAX_ATTEMPTS)
+
+    def _claim(self, user_id=None, due_only=True):
+        """Claim the job that has been due longest; returns (user_id, requests) or None."""
+        now = datetime.now()
+        query = select(AnalyticsJob.user_id).where(self._claimable(now))
+        if due_only:
+            query = query.where(AnalyticsJob.run_after <= now)
+        if user_id is not None:
+            query = query.where(AnalyticsJob.user_id == user_id)
+        # Another worker can claim the candidate first; then look again.
+        for candidate in db.session.execute(query.order_by(AnalyticsJob.run_after).limit(5)).scalars().all():
+            claimed = db.session.execute(
+                update(AnalyticsJob)
+                .where(AnalyticsJob.user_id == candidate, self._claimable(now))
+                .values(claimed_at=now))
+            if claimed.rowcount == 1:
+                requests = db.session.execute(
+                    select(AnalyticsJob.requests).where(AnalyticsJob.user_id == candidate)).scalar_one()
+                db.session.commit()
+                return candidate, requests
+        db.session.rollback()
+        return None
+
+    def _finish(self, user_id, requests):
+        done = db.session.execute(delete(AnalyticsJob).where(AnalyticsJob.user_id == user_id,
+                                                             AnalyticsJob.requests == requests))
+        if done.rowcount == 0:
+            # Written to while running; run once more for the newer writes.
+            db.session.execute(
+                update(AnalyticsJob).where(AnalyticsJob.user_id == user_id)
+                .values(requests=AnalyticsJob.requests - requests, claimed_at=None,
+                        run_after=datetime.now() + timedelta(seconds=self.delay)))
+        db.session.commit()
+
+    def _fail(self, user_id, error):
+        db.session.rollback()
+        db.session.execute(
+            update(AnalyticsJob).where(AnalyticsJob.user_id == user_id)
+            .values(claimed_at=None, attempts=AnalyticsJob.attempts + 1, last_error=str(error)[:500],
+                    run_after=datetime.now() + timedelta(seconds=RETRY_DELAY)))
+        db.session.commit()
+
+    def run_next(self, user_id=None, due_only=True):
+        """Claim and run one job (only the given user's, if set); returns False if none was waiting."""
+        claimed = self._claim(user_id, due_only)
+        if claimed is None:
+            return False
+        user_id, requests = claimed
+        started = time.perf_counter()
+        try:
+            refresh(user_id)
+        except Exception as e:
+            log.exception('Analytics job for user %s failed', user_id)
+            self._fail(user_id, e)
+            metrics.inc('spendly_jobs_total', (('outcome', 'failed'),))
+        else:
+            self._finish(user_id, requests)
+            metrics.inc('spendly_jobs_total', (('outcome', 'done'),))
+            metrics.inc('spendly_job_writes_coalesced_total', value=requests - 1)
+        metrics.observe('spendly_job_duration_seconds', (), time.perf_counter() - started)
+        return True
+
+    def run_pending(self, user_id=None):
+        """Run every waiting job now, without waiting for JOB_DELAY. Returns jobs run."""
+        count = 0
+        while self.run_next(user_id, due_only=False):
+            count += 1
+        return count
+
+    def _work(self):
+        while not self._stop.is_set():
+            try:
+                with self.app.app_context():
+                    ran = self.run_next()
+            except Exception:
+                log.exception('Job worker could not reach the queue')
+                ran = False
+            if not ran:
+                self._stop.wait(self.poll_interval)
+
+    def start(self, workers=None):
+        """Start the worker threads (JOB_WORKERS unless given); does nothing if already running."""
+        with self._lock:
+            if self._threads:
+                return
+            self._stop.clear()
+            for n in range(self.workers if workers is None else workers):
+                thread = threading.Thread(target=self._work, name=f'job-worker-{n}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _start_workers(self):
+        if self.workers > 0 and not self._threads:
+            self.start()
+
+    def shutdown(self, wait=True):
+        """Stop the workers after the job each is running."""
+        self._stop.set()
+        with self._lock:
+            threads, self._threads = self._threads, []
+        if wait:
+            for thread in threads:
+                thread.join()
+
+
+job_queue = JobQueue()
@@ -1,6 +1,10 @@
+import os
+
 from __init__ import create_app
 
-app = create_app()
+# The served app runs the analytics job workers (see jobs.py); set
+# JOB_WORKERS=0 when they run in a separate `python run_jobs.py` process.
+app = create_app({'JOB_WORKERS': int(os.environ.get('JOB_WORKERS', 1))})
 
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,314 @@
+"""Versioned schema migrations.
+
+Each file in migrations/ named NNNN_description.py is one revision and
+defines upgrade(op) and downgrade(op). Revisions apply in file name order and
+every applied revision is recorded in the schema_revision table.
+
+    python migrate.py upgrade [REVISION]     apply pending revisions (up to REVISION)
+    python migrate.py downgrade REVISION     revert revisions applied after REVISION ('base' for all)
+    python migrate.py current                show the newest applied revision
+    python migrate.py history                list revisions and whether each is applied
+
+Steps run in their own short transactions rather than one per revision, so
+a long backfill never holds the write lock for the whole table. Every
+operation checks the schema first, which makes re-running a revision that
+stopped halfway safe and lets databases created before this engine adopt
+it: the early revisions find their tables and columns already present.
+"""
+import argparse
+import glob
+import importlib.util
+import os
+import sys
+import time
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, MetaData, String, Table, func, inspect, select, text
+from sqlalchemy.schema import CreateColumn
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+BACKFILL_BATCH_SIZE = 500
+
+_metadata = MetaData()
+revision_table = Table(
+    'schema_revision', _metadata,
+    Column('revision', String(64), primary_key=True),
+    Column('description', String(200)),
+    Column('applied_at', DateTime, nullable=False),
+)
+
+
+class Revision:
+    def __init__(self, path):
+        self.id = os.path.splitext(os.path.basename(path))[0]
+        spec = importlib.util.spec_from_file_location(f'migrations.{self.id}', path)
+        self.module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(self.module)
+        doc = (self.module.__doc__ or '').strip()
+        self.description = doc.splitlines()[0] if doc else ''
+
+    def upgrade(self, op):
+        self.module.upgrade(op)
+
+    def downgrade(self, op):
+        self.module.downgrade(op)
+
+
+def load_revisions(directory=MIGRATIONS_DIR):
+    """Return every revision in migration order."""
+    paths = sorted(glob.glob(os.path.join(directory, '[0-9]*.py')))
+    return [Revision(path) for path in paths]
+
+
+class Operations:
+    """Schema operations handed to upgrade() and downgrade().
+
+    Each call commits on its own. Existence checks make every operation a
+    no-op when its work is already done.
+    """
+
+    def __init__(self, engine, log=print):
+        self.engine = engine
+        self.dialect = engine.dialect
+        self.log = log
+
+    def _quote(self, name):
+        return self.dialect.identifier_preparer.quote(name)
+
+    def has_table(self, name):
+        return inspect(self.engine).has_table(name)
+
+    def has_column(self, table, name):
+        return any(c['name'] == name for c in inspect(self.engine).get_columns(table))
+
+    def has_index(self, table, name):
+        return any(i['name'] == name for i in inspect(self.engine).get_indexes(table))
+
+    def execute(self, statement, parameters=None):
+        if isinstance(statement, str):
+            statement = text(statement)
+        with self.engine.begin() as conn:
+            return conn.execute(statement, parameters or {})
+
+    def create_table(self, name, *columns):
+        """Create a table from Column and constraint objects unless it exists."""
+        metadata = MetaData()
+        # Foreign keys compile against the referenced tables, so reflect them.
+        for column in columns:
+            for foreign_key in getattr(column, 'foreign_keys', ()):
+                referenced = foreign_key.target_fullname.split('.')[0]
+                if referenced != name and referenced not in metadata.tables:
+                    Table(referenced, metadata, autoload_with=self.engine)
+        table = Table(name, metadata, *columns)
+        if not self.has_table(name):
+            table.create(self.engine)
+            self.log(f'  created table {name}')
+        return table
+
+    def drop_table(self, name):
+        if self.has_table(name):
+            Table(name, MetaData()).drop(self.engine)
+            self.log(f'  dropped table {name}')
+
+    def add_column(self, table, column):
+        """Add a Column unless the table already has it.
+
+        A NOT NULL column needs a server_default so existing rows get a value.
+        """
+        if self.has_column(table, column.name):
+            return
+        Table(table, MetaData(), column)
+        ddl = CreateColumn(column).compile(dialect=self.dialect)
+        self.execute(f'ALTER TABLE {self._quote(table)} ADD COLUMN {ddl}')
+        self.log(f'  added column {table}.{column.name}')
+
+    def drop_column(self, table, name):
+        if self.has_column(table, name):
+            self.execute(f'ALTER TABLE {self._quote(table)} DROP COLUMN {self._quote(name)}')
+            self.log(f'  dropped column {table}.{name}')
+
+    def create_index(self, name, table, columns, unique=False):
+        """Create an index without blocking the table where the database allows it.
+
+        PostgreSQL builds it CONCURRENTLY, outside a transaction, so reads and
+        writes continue. SQLite has no online build; in WAL mode readers carry
+        on and writers wait only for this one statement.
+        """
+        if self.has_index(table, name):
+            return
+        column_list = ', '.join(self._quote(c) for c in columns)
+        unique_sql = 'UNIQUE ' if unique else ''
+        if self.dialect.name == 'postgresql':
+            with self.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+                conn.execute(text(f'CREATE {unique_sql}INDEX CONCURRENTLY IF NOT EXISTS '
+                                  f'{self._quote(name)} ON {self._quote(table)} ({column_list})'))
+        else:
+            self.execute(f'CREATE {unique_sql}INDEX {self._quote(name)} '
+                         f'ON {self._quote(table)} ({column_list})')
+        self.log(f'  created index {name}')
+
+    def drop_index(self, name, table):
+        if not self.has_index(table, name):
+            return
+        if self.dialect.name == 'postgresql':
+            with self.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+                conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS {self._quote(name)}'))
+        elif self.dialect.name in ('mysql', 'mariadb'):
+            self.execute(f'DROP INDEX {self._quote(name)} ON {self._quote(table)}')
+        else:
+            self.execute(f'DROP INDEX {self._quote(name)}')
+        self.log(f'  dropped index {name}')
+
+    def analyze(self, table):
+        """Refresh planner statistics after adding an index."""
+        self.execute(f'ANALYZE {self._quote(table)}')
+
+    def backfill(self, table, build_statement, key='id', batch_size=BACKFILL_BATCH_SIZE,
+                 pause=0.0):
+        """Run build_statement(low, high) over [low, high) ranges of table.key.
+
+        build_statement may return a list of statements, which run in one
+        transaction. A statement may also be a function of the connection,
+        for batches that compute their rows in Python. Each range commits separately, so other writers get the
+        lock between batches; pause (seconds) gives them more room on a busy
+        database. Returns the number of batches run.
+        """
+        key_column = Table(table, MetaData(), Column(key)).c[key]
+        with self.engine.connect() as conn:
+            low, high = conn.execute(select(func.min(key_column), func.max(key_column))).one()
+        if low is None:
+            return 0
+        batches = 0
+        started = time.perf_counter()
+        for start in range(low, high + 1, batch_size):
+            statements = build_statement(start, start + batch_size)
+            if not isinstance(statements, (list, tuple)):
+                statements = [statements]
+            with self.engine.begin() as conn:
+                for statement in statements:
+                    if callable(statement):
+                        statement(conn)
+                    else:
+                        conn.execute(statement)
+            batches += 1
+            if pause:
+                time.sleep(pause)
+        self.log(f'  backfilled {table} in {batches} batch(es), {time.perf_counter() - started:.1f}s')
+        return batches
+
+
+def applied_revisions(engine):
+    """Return the set of applied revision ids (empty before the first migration)."""
+    if not inspect(engine).has_table(revision_table.name):
+        return set()
+    with engine.connect() as conn:
+        return set(conn.execute(select(revision_table.c.revision)).scalars())
+
+
+def current_revision(engine, revisions=None):
+    applied = applied_revisions(engine)
+    current = None
+    for revision in revisions or load_revisions():
+        if revision.id in applied:
+            current = revision.id
+    return current
+
+
+def pending_revisions(engine, revisions=None):
+    applied = applied_revisions(engine)
+    return [r for r in (revisions or load_revisions()) if r.id not in applied]
+
+
+def _resolve(revisions, target):
+    ids = [r.id for r in revisions]
+    matches = [i for i in ids if i == target or i.split('_', 1)[0] == target]
+    if len(matches) != 1:
+        raise ValueError(f'Unknown revision: {target}')
+    return ids.index(matches[0])
+
+
+def upgrade(engine, target=None, log=print):
+    """Apply pending revisions in order, up to and including target."""
+    revisions = load_revisions()
+    last = _resolve(revisions, target) if target else len(revisions) - 1
+    revision_table.create(engine, checkfirst=True)
+    applied = applied_revisions(engine)
+    op = Operations(engine, log)
+    count = 0
+    for revision in revisions[:last + 1]:
+        if revision.id in applied:
+            continue
+        log(f'Upgrading to {revision.id}: {revision.description}')
+        revision.upgrade(op)
+        op.execute(revision_table.insert().values(
+            revision=revision.id, description=revision.description[:200],
+            applied_at=datetime.now()))
+        count += 1
+    return count
+
+
+def downgrade(engine, target, log=print):
+    """Revert applied revisions newer than target ('base' reverts everything)."""
+    revisions = load_revisions()
+    keep = -1 if target == 'base' else _resolve(revisions, target)
+    applied = applied_revisions(engine)
+    op = Operations(engine, log)
+    count = 0
+    for revision in reversed(revisions[keep + 1:]):
+        if revision.id not in applied:
+            continue
+        log(f'Downgrading {revision.id}: {revision.description}')
+        revision.downgrade(op)
+        op.execute(revision_table.delete().where(revision_table.c.revision == revision.id))
+        count += 1
+    return count
+
+
+def upgrade_on_start(app, engine):
+    """Bring the schema up to date at app start.
+
+    When nothing is pending this costs one small query, instead of the
+    reflection db.create_all() did on every start. Set MIGRATE_ON_START to
+    False to run `python migrate.py upgrade` as a separate deploy step.
+    """
+    if not app.config.get('MIGRATE_ON_START', True):
+        return
+    if pending_revisions(engine):
+        upgrade(engine, log=app.logger.info)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Apply or revert schema migrations.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    up = commands.add_parser('upgrade', help='apply pending revisions')
+    up.add_argument('revision', nargs='?', help='stop after this revision (default: latest)')
+    down = commands.add_parser('downgrade', help='revert to an earlier revision')
+    down.add_argument('revision', help="revision to keep, or 'base' to revert everything")
+    commands.add_parser('current', help='show the newest applied revision')
+    commands.add_parser('history', help='list revisions')
+    args = parser.parse_args()
+
+    from __init__ import create_app, db
+    app = create_app({'MIGRATE_ON_START': False})
+    with app.app_context():
+        engine = db.engine
+        try:
+            if args.command == 'upgrade':
+                count = upgrade(engine, args.revision)
+                print(f'Applied {count} revision(s); now at {current_revision(engine)}.')
+            elif args.command == 'downgrade':
+                count = downgrade(engine, args.revision)
+                print(f'Reverted {count} revision(s); now at {current_revision(engine) or "base"}.')
+            elif args.command == 'current':
+                print(current_revision(engine) or 'base')
+            else:
+                applied = applied_revisions(engine)
+                for revision in load_revisions():
+                    mark = '*' if revision.id in applied else ' '
+                    print(f'{mark} {revision.id:32} {revision.description}')
+        except ValueError as e:
+            sys.exit(str(e))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+"""Create the user, note, expense and account tables."""
+from sqlalchemy import Column, DateTime, Float, ForeignKey, Integer, String
+
+
+def upgrade(op):
+    op.create_table(
+        'user',
+        Column('id', Integer, primary_key=True),
+        Column('email', String(150), unique=True),
+        Column('password', String(150)),
+        Column('first_name', String(150)),
+    )
+    op.create_table(
+        'note',
+        Column('id', Integer, primary_key=True),
+        Column('data', String(10000)),
+        Column('date', DateTime(timezone=True)),
+        Column('user_id', Integer, ForeignKey('user.id')),
+    )
+    op.create_table(
+        'expense',
+        Column('id', Integer, primary_key=True),
+        Column('amount', Float, nullable=False),
+        Column('category', String(100), nullable=False),
+        Column('type', String(20), nullable=False),
+        Column('description', String(500)),
+        Column('payment_mode', String(50)),
+        Column('date', DateTime(timezone=True)),
+        Column('user_id', Integer, ForeignKey('user.id'), nullable=False),
+    )
+    op.create_table(
+        'account',
+        Column('id', Integer, primary_key=True),
+        Column('name', String(150), nullable=False),
+        Column('number', String(100), nullable=False),
+        Column('type', String(50), nullable=False),
+        Column('balance', Float, nullable=False),
+        Column('user_id', Integer, ForeignKey('user.id'), nullable=False),
+    )
+
+
+def downgrade(op):
+    for table in ('account', 'expense', 'note', 'user'):
+        op.drop_table(table)
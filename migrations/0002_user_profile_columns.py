@@ -0,0 +1,12 @@
+"""Add gender and phone number to user (formerly add_user_columns.py)."""
+from sqlalchemy import Column, String
+
+
+def upgrade(op):
+    op.add_column('user', Column('gender', String(20)))
+    op.add_column('user', Column('number', String(20)))
+
+
+def downgrade(op):
+    op.drop_column('user', 'number')
+    op.drop_column('user', 'gender')
@@ -0,0 +1,18 @@
+"""Index expense for per-user listings, daily series and account history."""
+
+INDEXES = {
+    'ix_expense_user_date': ['user_id', 'date'],
+    'ix_expense_user_type_date': ['user_id', 'type', 'date'],
+    'ix_expense_user_payment_mode': ['user_id', 'payment_mode'],
+}
+
+
+def upgrade(op):
+    for name, columns in INDEXES.items():
+        op.create_index(name, 'expense', columns)
+    op.analyze('expense')
+
+
+def downgrade(op):
+    for name in INDEXES:
+        op.drop_index(name, 'expense')
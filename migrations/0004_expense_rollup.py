@@ -0,0 +1,46 @@
+"""Add the expense_rollup table and backfill it from expense, a batch of users at a time."""
+from sqlalchemy import (Column, Float, ForeignKey, Integer, MetaData, String, Table,
+                        UniqueConstraint, delete, func, select)
+
+from database import month_of, upsert
+
+metadata = MetaData()
+expense = Table(
+    'expense', metadata,
+    Column('id', Integer), Column('user_id', Integer), Column('type', String),
+    Column('category', String), Column('amount', Float), Column('date', String),
+)
+
+
+def upgrade(op):
+    rollup = op.create_table(
+        'expense_rollup',
+        Column('id', Integer, primary_key=True),
+        Column('user_id', Integer, ForeignKey('user.id'), nullable=False),
+        Column('type', String(20), nullable=False),
+        Column('category', String(100), nullable=False),
+        Column('month', String(7), nullable=False),
+        Column('total', Float, nullable=False, default=0.0),
+        Column('count', Integer, nullable=False, default=0),
+        UniqueConstraint('user_id', 'type', 'category', 'month', name='uq_expense_rollup_key'),
+    )
+    month = month_of(expense.c.date)
+    # Totals are recomputed from expense and replace a bucket a concurrent
+    # add_expense may have created, so every batch can be run again.
+    fill = upsert(rollup, op.engine, index_elements=['user_id', 'type', 'category', 'month'],
+                  increment=[], replace=['total', 'count'])
+
+    def fill_users(low, high):
+        source = (select(expense.c.user_id, expense.c.type, expense.c.category, month,
+                         func.sum(expense.c.amount), func.count(expense.c.id))
+                  .where(expense.c.user_id >= low, expense.c.user_id < high)
+                  .group_by(expense.c.user_id, expense.c.type, expense.c.category, month))
+        in_range = (rollup.c.user_id >= low) & (rollup.c.user_id < high)
+        return [delete(rollup).where(in_range),
+                fill.from_select(['user_id', 'type', 'category', 'month', 'total', 'count'], source)]
+
+    op.backfill('user', fill_users, batch_size=200)
+
+
+def downgrade(op):
+    op.drop_table('expense_rollup')
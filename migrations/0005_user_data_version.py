@@ -0,0 +1,10 @@
+"""Add user.data_version, the counter that keys chart caches and ETags."""
+from sqlalchemy import Column, Integer
+
+
+def upgrade(op):
+    op.add_column('user', Column('data_version', Integer, nullable=False, server_default='0'))
+
+
+def downgrade(op):
+    op.drop_column('user', 'data_version')
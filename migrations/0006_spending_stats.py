@@ -0,0 +1,114 @@
+"""Add spending_stats and spending_anomaly and score existing history, a batch of users at a time."""
+import math
+
+from sqlalchemy import (Column, Date, Float, ForeignKey, Integer, MetaData, String, Table,
+                        UniqueConstraint, delete, func, insert, select)
+
+from database import day_of
+
+metadata = MetaData()
+user = Table('user', metadata, Column('id', Integer))
+expense = Table(
+    'expense', metadata,
+    Column('user_id', Integer), Column('type', String), Column('amount', Float),
+    Column('date', String),
+)
+
+# The scoring as of this revision, frozen here so later changes to
+# anomalies.py do not change what this migration writes. rebuild_anomalies.py
+# rescores with the current code.
+ALPHA = 2 / (60 + 1)
+MIN_DAYS = 5
+THRESHOLD = 2.0
+MIN_STD = 1.0
+
+
+def _fold(days, mean, var, amount):
+    if days == 0:
+        return 1, amount, 0.0
+    diff = amount - mean
+    incr = ALPHA * diff
+    return days + 1, mean + incr, (1 - ALPHA) * (var + diff * incr)
+
+
+def _fold_zeros(days, mean, var, count):
+    decay = (1 - ALPHA) ** count
+    return days + count, mean * decay, decay * (var + mean * mean * (1 - decay))
+
+
+def _score(user_id, totals):
+    """Score one user's (day, total) rows, oldest first; returns (stats, flagged)."""
+    days, mean, var = 0, 0.0, 0.0
+    flagged = []
+    open_day, open_total = None, 0.0
+    for day, total in totals:
+        if open_day is not None:
+            days, mean, var = _fold(days, mean, var, open_total)
+            gap = (day - open_day).days - 1
+            if gap:
+                days, mean, var = _fold_zeros(days, mean, var, gap)
+        if days >= MIN_DAYS:
+            z = (total - mean) / max(math.sqrt(var), MIN_STD)
+            if z > THRESHOLD:
+                flagged.append({'user_id': user_id, 'day': day, 'amount': total, 'z_score': z})
+        open_day, open_total = day, total
+    stats = {'user_id': user_id, 'day': open_day, 'day_total': open_total,
+             'days': days, 'mean': mean, 'var': var}
+    return stats, flagged
+
+
+def upgrade(op):
+    stats = op.create_table(
+        'spending_stats',
+        Column('user_id', Integer, ForeignKey('user.id'), primary_key=True),
+        Column('day', Date),
+        Column('day_total', Float, nullable=False, default=0.0),
+        Column('days', Integer, nullable=False, default=0),
+        Column('mean', Float, nullable=False, default=0.0),
+        Column('var', Float, nullable=False, default=0.0),
+    )
+    anomaly = op.create_table(
+        'spending_anomaly',
+        Column('id', Integer, primary_key=True),
+        Column('user_id', Integer, ForeignKey('user.id'), nullable=False),
+        Column('day', Date, nullable=False),
+        Column('amount', Float, nullable=False),
+        Column('z_score', Float, nullable=False),
+        UniqueConstraint('user_id', 'day', name='uq_spending_anomaly_day'),
+    )
+    day = day_of(expense.c.date)
+
+    def score_users(low, high):
+        def fill(conn):
+            user_ids = conn.execute(select(user.c.id).where(user.c.id >= low, user.c.id < high)
+                                    .order_by(user.c.id)).scalars().all()
+            rows = conn.execute(
+                select(expense.c.user_id, day, func.sum(expense.c.amount))
+                .where(expense.c.user_id >= low, expense.c.user_id < high, expense.c.type == 'Expense')
+                .group_by(expense.c.user_id, day)
+                .order_by(expense.c.user_id, day))
+            totals = {user_id: [] for user_id in user_ids}
+            for user_id, row_day, total in rows:
+                totals.setdefault(user_id, []).append((row_day, total or 0.0))
+            scored, flagged = [], []
+            for user_id, user_totals in totals.items():
+                user_stats, user_flagged = _score(user_id, user_totals)
+                scored.append(user_stats)
+                flagged.extend(user_flagged)
+            if scored:
+                conn.execute(insert(stats), scored)
+            if flagged:
+                conn.execute(insert(anomaly), flagged)
+
+        # Each batch replaces what an earlier, interrupted run or a
+        # concurrent add_expense wrote for its users, so it can be run again.
+        return [delete(anomaly).where(anomaly.c.user_id >= low, anomaly.c.user_id < high),
+                delete(stats).where(stats.c.user_id >= low, stats.c.user_id < high),
+                fill]
+
+    op.backfill('user', score_users)
+
+
+def downgrade(op):
+    op.drop_table('spending_anomaly')
+    op.drop_table('spending_stats')
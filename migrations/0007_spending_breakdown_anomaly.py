@@ -0,0 +1,21 @@
+"""Add spending_breakdown_anomaly, filled by the nightly per-category/account batch."""
+from sqlalchemy import Column, Date, Float, ForeignKey, Integer, String, UniqueConstraint
+
+
+def upgrade(op):
+    op.create_table(
+        'spending_breakdown_anomaly',
+        Column('id', Integer, primary_key=True),
+        Column('user_id', Integer, ForeignKey('user.id'), nullable=False),
+        Column('dimension', String(20), nullable=False),
+        Column('key', String(100), nullable=False),
+        Column('day', Date, nullable=False),
+        Column('amount', Float, nullable=False),
+        Column('z_score', Float, nullable=False),
+        UniqueConstraint('user_id', 'dimension', 'key', 'day',
+                         name='uq_spending_breakdown_anomaly_day'),
+    )
+
+
+def downgrade(op):
+    op.drop_table('spending_breakdown_anomaly')
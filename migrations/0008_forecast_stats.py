@@ -0,0 +1,18 @@
+"""Add forecast_stats; rows are filled on the next write or `python rebuild_forecasts.py`."""
+from sqlalchemy import Column, Date, Float, ForeignKey, Integer
+
+
+def upgrade(op):
+    op.create_table(
+        'forecast_stats',
+        Column('user_id', Integer, ForeignKey('user.id'), primary_key=True),
+        Column('first_day', Date),
+        Column('end_day', Date, nullable=False),
+        Column('sum_y', Float, nullable=False, default=0.0),
+        Column('sum_xy', Float, nullable=False, default=0.0),
+        Column('count', Integer, nullable=False, default=0),
+    )
+
+
+def downgrade(op):
+    op.drop_table('forecast_stats')
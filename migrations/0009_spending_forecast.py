@@ -0,0 +1,21 @@
+"""Add spending_forecast; rows are filled by `python rebuild_forecasts.py --holt-winters`."""
+from sqlalchemy import JSON, Column, Date, Float, ForeignKey, Integer
+
+
+def upgrade(op):
+    op.create_table(
+        'spending_forecast',
+        Column('user_id', Integer, ForeignKey('user.id'), primary_key=True),
+        Column('through', Date, nullable=False),
+        Column('level', Float, nullable=False),
+        Column('trend', Float, nullable=False),
+        Column('season', JSON, nullable=False),
+        Column('alpha', Float, nullable=False),
+        Column('beta', Float, nullable=False),
+        Column('gamma', Float, nullable=False),
+        Column('rmse', Float, nullable=False),
+    )
+
+
+def downgrade(op):
+    op.drop_table('spending_forecast')
@@ -0,0 +1,19 @@
+"""Add analytics_job, the queue of per-user analytics recomputes run by jobs.py."""
+from sqlalchemy import Column, DateTime, ForeignKey, Integer, String
+
+
+def upgrade(op):
+    op.create_table(
+        'analytics_job',
+        Column('user_id', Integer, ForeignKey('user.id'), primary_key=True),
+        Column('requests', Integer, nullable=False, default=1),
+        Column('run_after', DateTime, nullable=False),
+        Column('claimed_at', DateTime),
+        Column('attempts', Integer, nullable=False, default=0),
+        Column('last_error', String(500)),
+    )
+    op.create_index('ix_analytics_job_run_after', 'analytics_job', ['run_after'])
+
+
+def downgrade(op):
+    op.drop_table('analytics_job')
@@ -20,6 +20,15 @@ class Expense(db.Model):
     date = db.Column(db.DateTime(timezone=True), default=func.now())
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
 
+    __table_args__ = (
+        # Recent-first listings (dashboard, reports).
+        db.Index('ix_expense_user_date', 'user_id', 'date'),
+        # Daily spending series and per-type filters.
+        db.Index('ix_expense_user_type_date', 'user_id', 'type', 'date'),
+        # Account history matches payment_mode against the account.
+        db.Index('ix_expense_user_payment_mode', 'user_id', 'payment_mode'),
+    )
+
 
 class Account(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -36,6 +45,116 @@ class User(db.Model, UserMixin):
     first_name = db.Column(db.String(150))
     gender = db.Column(db.String(20))
     number = db.Column(db.String(20))
+    # Bumped on every transaction write; keys caches of derived charts.
+    data_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     notes = db.relationship('Note')
     expenses = db.relationship('Expense')
     accounts = db.relationship('Account')
+
+
+class ExpenseRollup(db.Model):
+    """Per user x type x category x month totals, kept in step with Expense writes."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    type = db.Column(db.String(20), nullable=False)
+    category = db.Column(db.String(100), nullable=False)
+    month = db.Column(db.String(7), nullable=False)  # 'YYYY-MM'
+    total = db.Column(db.Float, nullable=False, default=0)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'type', 'category', 'month', name='uq_expense_rollup_key'),
+    )
+
+
+class SpendingStats(db.Model):
+    """Running statistics of a user's daily expense totals, for online anomaly detection.
+
+    `day` is the newest day with spending; its total is still accumulating
+    and is not yet folded into mean/var.
+    """
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    day = db.Column(db.Date)
+    day_total = db.Column(db.Float, nullable=False, default=0)
+    days = db.Column(db.Integer, nullable=False, default=0)  # days folded into mean/var
+    mean = db.Column(db.Float, nullable=False, default=0)
+    var = db.Column(db.Float, nullable=False, default=0)
+
+
+class SpendingAnomaly(db.Model):
+    """A day whose expense total was flagged against the stats before it."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    amount = db.Column(db.Float, nullable=False)
+    z_score = db.Column(db.Float, nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'day', name='uq_spending_anomaly_day'),
+    )
+
+
+class SpendingBreakdownAnomaly(db.Model):
+    """A day whose spending in one category or account was flagged by the nightly batch."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    dimension = db.Column(db.String(20), nullable=False)  # 'category' or 'account'
+    key = db.Column(db.String(100), nullable=False)  # category name or payment mode
+    day = db.Column(db.Date, nullable=False)
+    amount = db.Column(db.Float, nullable=False)
+    z_score = db.Column(db.Float, nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'dimension', 'key', 'day',
+                            name='uq_spending_breakdown_anomaly_day'),
+    )
+
+
+class ForecastStats(db.Model):
+    """Least-squares sufficient statistics of a user's recent daily spending.
+
+    Sums cover the forecast window ending on end_day, with x in days
+    relative to end_day; see forecasts.py.
+    """
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    first_day = db.Column(db.Date)  # first day with an expense
+    end_day = db.Column(db.Date, nullable=False)
+    sum_y = db.Column(db.Float, nullable=False, default=0)
+    sum_xy = db.Column(db.Float, nullable=False, default=0)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class SpendingForecast(db.Model):
+    """Weekly-seasonal (Holt-Winters) state of a user's daily spending, fitted nightly.
+
+    The forecast for day d is level + (d - through).days * trend plus the
+    seasonal offset of d's weekday; see forecasts.precompute.
+    """
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    through = db.Column(db.Date, nullable=False)  # last day fitted
+    level = db.Column(db.Float, nullable=False)
+    trend = db.Column(db.Float, nullable=False)
+    season = db.Column(db.JSON, nullable=False)  # 7 offsets, Monday first
+    alpha = db.Column(db.Float, nullable=False)
+    beta = db.Column(db.Float, nullable=False)
+    gamma = db.Column(db.Float, nullable=False)
+    rmse = db.Column(db.Float, nullable=False)
+
+
+class AnalyticsJob(db.Model):
+    """A pending recompute of one user's derived analytics; see jobs.py.
+
+    There is at most one row per user, so writes made while it is pending
+    fold into it and are handled by a single run.
+    """
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    requests = db.Column(db.Integer, nullable=False, default=1)  # writes folded in
+    run_after = db.Column(db.DateTime, nullable=False)
+    claimed_at = db.Column(db.DateTime)  # set while a worker runs it
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.String(500))
+
+    __table_args__ = (
+        # Workers pick the job that has been due longest.
+        db.Index('ix_analytics_job_run_after', 'run_after'),
+    )
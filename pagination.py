@@ -0,0 +1,78 @@
+import base64
+import json
+
+from sqlalchemy import String, and_, or_, type_coerce
+
+from models import Expense
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+STREAM_BATCH_SIZE = 500
+
+
+def _date_key():
+    # Compare dates exactly as stored. SQLite keeps them as text and rows written
+    # by func.now() lack the microseconds a Python datetime bind would add, so a
+    # re-bound datetime would not match the row the cursor came from.
+    return type_coerce(Expense.date, String)
+
+
+def encode_cursor(date_key, expense_id):
+    """Pack a (date, id) keyset position into an opaque URL-safe token."""
+    raw = json.dumps([str(date_key), expense_id], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Unpack a token from encode_cursor; raises ValueError if it was tampered with."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        date_key, expense_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return str(date_key), int(expense_id)
+    except (TypeError, ValueError, UnicodeDecodeError) as e:
+        raise ValueError('Invalid cursor') from e
+
+
+def recent_first(query):
+    """Order an Expense query newest first, with id as the tie-breaker keyset column."""
+    return query.order_by(Expense.date.desc(), Expense.id.desc())
+
+
+def keyset_page(query, cursor=None, limit=PAGE_SIZE):
+    """Return (transactions, next_cursor) for one page of an Expense query.
+
+    Seeks past the cursor with a (date, id) predicate instead of OFFSET, so
+    every page costs the same index range scan however deep it is.
+    next_cursor is None on the last page.
+    """
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    page = recent_first(query.add_columns(_date_key()))
+    if cursor:
+        date_key, expense_id = decode_cursor(cursor)
+        page = page.filter(or_(_date_key() < date_key,
+                               and_(_date_key() == date_key, Expense.id < expense_id)))
+
+    rows = page.limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last_expense, last_date_key = rows[-1]
+        next_cursor = encode_cursor(last_date_key, last_expense.id)
+    return [expense for expense, _ in rows], next_cursor
+
+
+def iter_all(query, batch_size=STREAM_BATCH_SIZE):
+    """Yield every row of an Expense query newest first, fetching in batches."""
+    return recent_first(query).yield_per(batch_size)
+
+
+def to_dict(expense):
+    return {
+        'id': expense.id,
+        'date': expense.date.isoformat() if expense.date else None,
+        'type': expense.type,
+        'category': expense.category,
+        'description': expense.description,
+        'payment_mode': expense.payment_mode,
+        'amount': expense.amount,
+    }
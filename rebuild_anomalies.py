@@ -0,0 +1,40 @@
+import argparse
+import sys
+import time
+
+from __init__ import create_app, db
+from chart_cache import bump_data_version
+import anomalies
+
+parser = argparse.ArgumentParser(description='Rescore anomaly stats and flagged days from the expense table.')
+parser.add_argument('--user', type=int, help='only process this user id')
+parser.add_argument('--breakdowns', action='store_true',
+                    help='score per-category and per-account days instead (the nightly job)')
+parser.add_argument('--batch-size', type=int, default=anomalies.REBUILD_BATCH_SIZE,
+                    help='users scored per NumPy pass')
+parser.add_argument('--check', action='store_true',
+                    help='compare the stored stats with a batch recompute instead of rescoring')
+args = parser.parse_args()
+
+app = create_app()
+
+with app.app_context():
+    if args.check:
+        mismatches = anomalies.check_consistency(args.user)
+        for m in mismatches:
+            print(f"user={m['user_id']}: stored {m['stored']}, expected {m['expected']}")
+        if mismatches:
+            print(f"Anomaly stats are inconsistent: {len(mismatches)} user(s) differ.")
+            sys.exit(1)
+        print("Anomaly stats are consistent.")
+        sys.exit(0)
+
+    started = time.perf_counter()
+    if args.breakdowns:
+        count = anomalies.rebuild_breakdowns(args.user, args.batch_size, log=print)
+    else:
+        count = anomalies.rebuild(args.user, args.batch_size, log=print)
+    bump_data_version(args.user)
+    db.session.commit()
+    elapsed = time.perf_counter() - started
+    print(f"Rescored {count} user(s) in {elapsed:.1f}s ({count / elapsed:,.0f} users/s).")
@@ -0,0 +1,42 @@
+import argparse
+import sys
+import time
+
+from __init__ import create_app
+import forecasts
+
+parser = argparse.ArgumentParser(description='Recompute or move forward the stored forecast statistics.')
+parser.add_argument('--user', type=int, help='only process this user id')
+parser.add_argument('--roll', action='store_true',
+                    help='only move each window forward to today')
+parser.add_argument('--holt-winters', action='store_true',
+                    help='only refit the weekly-pattern forecast through yesterday')
+parser.add_argument('--nightly', action='store_true',
+                    help='--roll, then --holt-winters (the nightly job)')
+parser.add_argument('--check', action='store_true',
+                    help='compare the stored statistics, moved to today, with a recompute')
+parser.add_argument('--batch-size', type=int, default=forecasts.ROLL_BATCH_SIZE)
+args = parser.parse_args()
+
+app = create_app()
+
+with app.app_context():
+    if args.check:
+        mismatches = forecasts.check_consistency(args.user)
+        for m in mismatches:
+            print(f"user={m['user_id']}: stored {m['stored']}, expected {m['expected']}")
+        if mismatches:
+            print(f"Forecast statistics are inconsistent: {len(mismatches)} user(s) differ.")
+            sys.exit(1)
+        print("Forecast statistics are consistent.")
+        sys.exit(0)
+
+    started = time.perf_counter()
+    if args.roll or args.nightly:
+        count = forecasts.roll(args.user, args.batch_size, log=print)
+    if args.holt_winters or args.nightly:
+        count = forecasts.precompute(args.user, args.batch_size, log=print)
+    if not (args.roll or args.holt_winters or args.nightly):
+        count = forecasts.rebuild(args.user, args.batch_size, log=print)
+    elapsed = time.perf_counter() - started
+    print(f"Updated {count} user(s) in {elapsed:.1f}s.")
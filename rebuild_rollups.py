@@ -0,0 +1,28 @@
+import argparse
+import sys
+
+from __init__ import create_app
+import rollups
+
+parser = argparse.ArgumentParser(description='Rebuild or verify the expense rollup table.')
+parser.add_argument('--user', type=int, help='only process this user id')
+parser.add_argument('--check', action='store_true',
+                    help='compare the rollup with a raw recompute instead of rebuilding')
+args = parser.parse_args()
+
+app = create_app()
+
+with app.app_context():
+    if args.check:
+        mismatches = rollups.check_consistency(args.user)
+        for m in mismatches:
+            print(f"user={m['user_id']} {m['type']}/{m['category']} {m['month']}: "
+                  f"rollup {m['rollup_total']:.2f} ({m['rollup_count']} rows), "
+                  f"expected {m['expected_total']:.2f} ({m['expected_count']} rows)")
+        if mismatches:
+            print(f"Rollup is inconsistent: {len(mismatches)} bucket(s) differ.")
+            sys.exit(1)
+        print("Rollup is consistent.")
+    else:
+        rollups.rebuild(args.user)
+        print("Rollup rebuilt.")
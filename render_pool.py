@@ -0,0 +1,83 @@
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, wait
+
+from ai_models import run_render_job
+
+log = logging.getLogger(__name__)
+
+
+def _warm_worker():
+    # Pay matplotlib's import and font cache cost once per worker, not per chart.
+    import ai_models
+    ai_models.render_pie_chart({})
+
+
+class RenderPool:
+    """Optional process pool that renders several charts concurrently.
+
+    matplotlib holds the GIL for the whole render, so threads cannot overlap
+    charts; separate processes can. With CHART_RENDER_WORKERS at 0 (the
+    default), or if the pool fails, jobs render in-process one after another.
+    """
+
+    def __init__(self, workers=0, start_method='spawn', timeout=30):
+        self.workers = workers
+        self.start_method = start_method
+        self.timeout = timeout
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.workers = app.config.get('CHART_RENDER_WORKERS', self.workers)
+        self.start_method = app.config.get('CHART_RENDER_START_METHOD', self.start_method)
+        self.timeout = app.config.get('CHART_RENDER_TIMEOUT', self.timeout)
+        app.extensions['render_pool'] = self
+
+    @property
+    def enabled(self):
+        return self.workers > 0
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                context = multiprocessing.get_context(self.start_method)
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=context,
+                                                     initializer=_warm_worker)
+            return self._executor
+
+    def render_many(self, jobs):
+        """Render {key: (function_name, args)} jobs and return {key: png_bytes}."""
+        if not jobs:
+            return {}
+        if not self.enabled or len(jobs) == 1:
+            return {key: run_render_job(*job) for key, job in jobs.items()}
+
+        try:
+            executor = self._get_executor()
+            futures = {key: executor.submit(run_render_job, *job) for key, job in jobs.items()}
+            wait(futures.values(), timeout=self.timeout)
+        except Exception:
+            log.exception('Render pool unavailable, rendering in-process')
+            self.shutdown()
+            return {key: run_render_job(*job) for key, job in jobs.items()}
+
+        results = {}
+        for key, future in futures.items():
+            try:
+                results[key] = future.result(timeout=0)
+            except Exception:
+                log.exception('Render pool job %s failed, rendering in-process', key)
+                results[key] = run_render_job(*jobs[key])
+        return results
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+render_pool = RenderPool()
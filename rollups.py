@@ -0,0 +1,168 @@
+from sqlalchemy import func, insert
+
+from __init__ import db
+from database import month_of, upsert
+from chart_cache import bump_data_version
+from models import Expense, ExpenseRollup
+
+
+# Totals drift by float rounding as rows are added and removed; anything
+# below this is not a real inconsistency.
+TOLERANCE = 0.005
+# Users per statement when rebuilding a list of users.
+REBUILD_BATCH_SIZE = 500
+
+
+def _month_of(date):
+    return date.strftime('%Y-%m')
+
+
+def _month_expr():
+    return month_of(Expense.date)
+
+
+def _upsert():
+    return upsert(ExpenseRollup.__table__, db.session.get_bind(mapper=ExpenseRollup),
+                  index_elements=['user_id', 'type', 'category', 'month'],
+                  increment=['total', 'count'])
+
+
+def record_expense(expense, sign=1):
+    """Add (sign=1) or remove (sign=-1) one expense from its rollup bucket.
+
+    Runs inside the caller's transaction so the rollup commits or rolls back
+    together with the Expense write. The expense must be flushed so its
+    server-side default date is available.
+    """
+    db.session.execute(_upsert().values(
+        user_id=expense.user_id,
+        type=expense.type,
+        category=expense.category,
+        month=_month_of(expense.date),
+        total=expense.amount * sign,
+        count=sign,
+    ))
+    if sign < 0:
+        # Drop buckets that no longer hold any transaction.
+        (ExpenseRollup.query
+         .filter_by(user_id=expense.user_id, type=expense.type,
+                    category=expense.category, month=_month_of(expense.date))
+         .filter(ExpenseRollup.count <= 0)
+         .delete(synchronize_session=False))
+
+
+def add_to_buckets(buckets, expense_type, category, date, amount):
+    """Accumulate one new row into a {(type, category, month): [total, count]} dict."""
+    bucket = buckets.setdefault((expense_type, category, _month_of(date)), [0.0, 0])
+    bucket[0] += amount
+    bucket[1] += 1
+
+
+def apply_buckets(user_id, buckets):
+    """Fold accumulated bucket deltas into the rollup with one batched upsert.
+
+    Used by bulk writers that insert many rows and update the rollup once.
+    Runs inside the caller's transaction.
+    """
+    if not buckets:
+        return
+    db.session.execute(_upsert(), [
+        {'user_id': user_id, 'type': expense_type, 'category': category,
+         'month': month, 'total': total, 'count': count}
+        for (expense_type, category, month), (total, count) in buckets.items()
+    ])
+
+
+def rebuild(user_id=None):
+    """Recompute rollup rows from the Expense table (all users, one user or a list of users)."""
+    if isinstance(user_id, (list, tuple)):
+        for start in range(0, len(user_id), REBUILD_BATCH_SIZE):
+            _rebuild(user_id[start:start + REBUILD_BATCH_SIZE])
+    else:
+        _rebuild(user_id)
+
+
+def _rebuild(user_id):
+    delete = ExpenseRollup.query
+    source = (db.session.query(
+                  Expense.user_id,
+                  Expense.type,
+                  Expense.category,
+                  _month_expr(),
+                  func.sum(Expense.amount),
+                  func.count(Expense.id))
+              .group_by(Expense.user_id, Expense.type, Expense.category, _month_expr()))
+    if isinstance(user_id, (list, tuple)):
+        delete = delete.filter(ExpenseRollup.user_id.in_(user_id))
+        source = source.filter(Expense.user_id.in_(user_id))
+    elif user_id is not None:
+        delete = delete.filter_by(user_id=user_id)
+        source = source.filter(Expense.user_id == user_id)
+
+    delete.delete(synchronize_session=False)
+    db.session.execute(
+        insert(ExpenseRollup).from_select(
+            ['user_id', 'type', 'category', 'month', 'total', 'count'],
+            source,
+        )
+    )
+    # Charts cached from the old totals are no longer valid.
+    bump_data_version(user_id)
+    db.session.commit()
+
+
+def check_consistency(user_id=None):
+    """Compare rollup rows with a raw recompute.
+
+    Returns a list of mismatch dicts; an empty list means the rollup is exact.
+    """
+    raw_query = (db.session.query(
+                     Expense.user_id, Expense.type, Expense.category, _month_expr(),
+                     func.sum(Expense.amount), func.count(Expense.id))
+                 .group_by(Expense.user_id, Expense.type, Expense.category, _month_expr()))
+    rollup_query = db.session.query(
+        ExpenseRollup.user_id, ExpenseRollup.type, ExpenseRollup.category,
+        ExpenseRollup.month, ExpenseRollup.total, ExpenseRollup.count)
+    if user_id is not None:
+        raw_query = raw_query.filter(Expense.user_id == user_id)
+        rollup_query = rollup_query.filter(ExpenseRollup.user_id == user_id)
+
+    raw = {tuple(row[:4]): (float(row[4] or 0), int(row[5])) for row in raw_query}
+    rolled = {tuple(row[:4]): (float(row[4] or 0), int(row[5])) for row in rollup_query}
+
+    mismatches = []
+    for key in sorted(set(raw) | set(rolled), key=str):
+        expected = raw.get(key, (0.0, 0))
+        actual = rolled.get(key, (0.0, 0))
+        if expected[1] != actual[1] or abs(expected[0] - actual[0]) > TOLERANCE:
+            mismatches.append({
+                'user_id': key[0],
+                'type': key[1],
+                'category': key[2],
+                'month': key[3],
+                'expected_total': expected[0],
+                'rollup_total': actual[0],
+                'expected_count': expected[1],
+                'rollup_count': actual[1],
+            })
+    return mismatches
+
+
+def type_totals(user_id):
+    """Return (total_income, total_expense) for a user from the rollup."""
+    rows = (db.session.query(ExpenseRollup.type, func.sum(ExpenseRollup.total))
+            .filter(ExpenseRollup.user_id == user_id)
+            .group_by(ExpenseRollup.type)
+            .all())
+    totals = dict(rows)
+    return float(totals.get('Income') or 0), float(totals.get('Expense') or 0)
+
+
+def category_totals(user_id, expense_type):
+    """Return dict {category: total} for one type from the rollup."""
+    rows = (db.session.query(ExpenseRollup.category, func.sum(ExpenseRollup.total))
+            .filter(ExpenseRollup.user_id == user_id,
+                    ExpenseRollup.type == expense_type)
+            .group_by(ExpenseRollup.category)
+            .all())
+    return {category: float(total) for category, total in rows}
@@ -0,0 +1,28 @@
+import argparse
+import time
+
+from __init__ import create_app
+from jobs import job_queue
+
+parser = argparse.ArgumentParser(description='Run queued analytics jobs in a separate worker process.')
+parser.add_argument('--workers', type=int, default=2, help='worker threads')
+parser.add_argument('--once', action='store_true',
+                    help='run every waiting job now, then exit')
+args = parser.parse_args()
+
+# Web processes may keep their own workers; a claimed job is never run twice.
+app = create_app()
+
+if args.once:
+    with app.app_context():
+        started = time.perf_counter()
+        count = job_queue.run_pending()
+        print(f"Ran {count} job(s) in {time.perf_counter() - started:.1f}s.")
+else:
+    job_queue.start(args.workers)
+    print(f"Running analytics jobs with {args.workers} worker(s); Ctrl+C to stop.")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        job_queue.shutdown()
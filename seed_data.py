@@ -1,66 +1,211 @@
+"""Generate synthetic users, accounts and transactions for demos and load tests.
 
-from __init__ import create_app, db
-from models import User, Expense
-from datetime import datetime, timedelta
-import random
+    python seed_data.py                                  # test@test.com, 60 days
+    python seed_data.py --users 1000 --transactions 10000 --database sqlite:////tmp/load.db
+
+The same --seed and --end-date always produce the same rows. Each user is
+generated from its own random stream, so user N looks the same whatever
+--users is. Rows go in through batched executemany inserts and the rollup
+is rebuilt once at the end.
+"""
+import argparse
+import time
+from datetime import date, timedelta
+
+import numpy as np
+from sqlalchemy import insert
 from werkzeug.security import generate_password_hash
 
-app = create_app()
-
-with app.app_context():
-    # Check if test user exists
-    user = User.query.filter_by(email='test@test.com').first()
-    if not user:
-        user = User(
-            email='test@test.com',
-            first_name='TestUser',
-            password=generate_password_hash('password'),
-            gender='Male',
-            number='1234567890'
-        )
-        db.session.add(user)
+from __init__ import create_app, db
+from models import User, Expense, Account
+import anomalies
+import forecasts
+import rollups
+
+# Categories offered by the add-transaction form (static/index.js).
+INCOME_CATEGORIES = ['Parents', 'Salary', 'Sale', 'Grants', 'Gift', 'Interest']
+EXPENSE_CATEGORIES = ['Food', 'Beauty', 'Entertainment', 'Education', 'Health', 'Bills',
+                      'Shopping', 'Car', 'Baby', 'Sports', 'Tax', 'Transportation',
+                      'Utilities', 'Other']
+
+# Relative frequency and median amount of each category.
+INCOME_WEIGHTS = [0.05, 0.55, 0.15, 0.05, 0.10, 0.10]
+INCOME_MEDIANS = [300, 2500, 150, 500, 80, 20]
+EXPENSE_WEIGHTS = [0.25, 0.03, 0.07, 0.03, 0.04, 0.08, 0.12, 0.06, 0.03, 0.03, 0.01,
+                   0.12, 0.06, 0.07]
+EXPENSE_MEDIANS = [18, 40, 35, 120, 60, 90, 55, 45, 30, 25, 300, 12, 80, 20]
+
+# Accounts every seeded user gets, as (name, type). Transactions reference an
+# account by id, as the dashboard form does; a share use the old free-text modes.
+ACCOUNTS = [('Wallet', 'Cash'), ('Checking', 'Bank'), ('Credit Card', 'Card'), ('UPI', 'UPI')]
+LEGACY_PAYMENT_MODES = ['Cash', 'Credit Card', 'UPI']
+LEGACY_SHARE = 0.1
+
+INCOME_SHARE = 0.12
+ANOMALY_RATE = 0.002
+# Spending by weekday (Monday first) and by month (January first).
+WEEKDAY_FACTORS = np.array([0.9, 0.9, 0.95, 1.0, 1.15, 1.3, 1.1])
+MONTH_FACTORS = np.array([0.85, 0.85, 0.95, 1.0, 1.0, 1.05, 1.1, 1.05, 0.95, 1.0, 1.15, 1.4])
+
+SEED_EMAIL = 'test@test.com'
+SEED_PASSWORD = 'password'
+BATCH_SIZE = 50_000
+
+
+def seed_email(index):
+    return SEED_EMAIL if index == 0 else f'seed{index}@example.com'
+
+
+def _day_weights(start, days):
+    """Probability of a transaction landing on each day, from weekly and yearly seasonality."""
+    calendar = np.datetime64(start, 'D') + np.arange(days)
+    weekdays = (calendar.astype(int) + 3) % 7  # 1970-01-01 was a Thursday
+    months = calendar.astype('datetime64[M]').astype(int) % 12
+    weights = WEEKDAY_FACTORS[weekdays] * MONTH_FACTORS[months]
+    return weights / weights.sum()
+
+
+def generate_transactions(rng, count, start, days, account_ids, anomaly_rate=ANOMALY_RATE):
+    """Return column arrays for one user's transactions.
+
+    Spending drifts upwards over the period and follows the weekly and
+    yearly factors above; about anomaly_rate of expenses are multiplied
+    8-20x and labelled so detectors can be checked against them.
+    """
+    weights = _day_weights(start, days)
+    day = rng.choice(days, size=count, p=weights)
+    seconds = rng.integers(7 * 3600, 23 * 3600, size=count)
+    dates = (np.datetime64(start, 's') + day * 86400 + seconds).astype('datetime64[us]')
+
+    is_income = rng.random(count) < INCOME_SHARE
+    income_category = rng.choice(len(INCOME_CATEGORIES), size=count, p=INCOME_WEIGHTS)
+    expense_category = rng.choice(len(EXPENSE_CATEGORIES), size=count, p=EXPENSE_WEIGHTS)
+    medians = np.where(is_income, np.take(INCOME_MEDIANS, income_category),
+                       np.take(EXPENSE_MEDIANS, expense_category))
+    trend = 1 + 0.3 * day / max(days, 1)
+    season = np.where(is_income, 1.0, MONTH_FACTORS[dates.astype('datetime64[M]').astype(int) % 12])
+    amounts = medians * rng.lognormal(0, 0.45, size=count) * trend * season
+
+    injected = ~is_income & (rng.random(count) < anomaly_rate)
+    amounts[injected] *= rng.uniform(8, 20, size=int(injected.sum()))
+    amounts = np.maximum(np.round(amounts, 2), 0.01)
+
+    modes = np.take(np.array([str(i) for i in account_ids] or LEGACY_PAYMENT_MODES, dtype=object),
+                    rng.integers(0, max(len(account_ids), 1), size=count))
+    legacy = rng.random(count) < LEGACY_SHARE
+    modes[legacy] = np.take(np.array(LEGACY_PAYMENT_MODES, dtype=object),
+                            rng.integers(0, len(LEGACY_PAYMENT_MODES), size=int(legacy.sum())))
+
+    categories = np.where(is_income, np.take(INCOME_CATEGORIES, income_category),
+                          np.take(EXPENSE_CATEGORIES, expense_category)).astype(object)
+    descriptions = np.char.add(categories.astype(str), ' (seeded)').astype(object)
+    descriptions[injected] = 'Synthetic anomaly'
+
+    return {
+        'amount': amounts,
+        'category': categories,
+        'type': np.where(is_income, 'Income', 'Expense').astype(object),
+        'description': descriptions,
+        'payment_mode': modes,
+        'date': dates.astype(object),
+    }
+
+
+def _insert_columns(user_id, columns, batch_size):
+    # A Core insert on the table skips the ORM bulk-insert bookkeeping,
+    # which costs more than the executemany itself at this volume.
+    statement = insert(Expense.__table__)
+    rows = [
+        {'amount': amount, 'category': category, 'type': expense_type, 'description': description,
+         'payment_mode': payment_mode, 'date': date, 'user_id': user_id}
+        for amount, category, expense_type, description, payment_mode, date in zip(
+            columns['amount'].tolist(), columns['category'].tolist(), columns['type'].tolist(),
+            columns['description'].tolist(), columns['payment_mode'].tolist(),
+            columns['date'].tolist())
+    ]
+    for offset in range(0, len(rows), batch_size):
+        db.session.connection().execute(statement, rows[offset:offset + batch_size])
         db.session.commit()
-        print("Created test user (test@test.com / password)")
-    
-    # Generate expenses for the last 60 days to show a trend
-    categories = ['Food', 'Transport', 'Utilities', 'Entertainment', 'Shopping']
-    payment_modes = ['Cash', 'Credit Card', 'UPI']
-    
-    expenses = []
-    base_date = datetime.now()
-    
-    # Message
-    print("Seeding expenses...")
-    
-    for i in range(60):
-        # Create a slight upward trend in spending for 'Food' to demo the AI
-        date_offset = base_date - timedelta(days=(60-i))
-        
-        # Daily random expense
-        amount = random.uniform(10, 50) + (i * 0.5) # Slight trend upwards
-        category = random.choice(categories)
-        if category == 'Food':
-            amount += 20 # Food is more expensive
-            
-        # Add an anomaly
-        if i == 50:
-            amount = 500 # Anomaly!
-            category = 'Shopping'
-            description = 'AI Anomaly Detection Test (Big Purchase)'
-        else:
-            description = f'Seeded expense {i}'
-
-        expense = Expense(
-            amount=round(amount, 2),
-            category=category,
-            type='Expense',
-            description=description,
-            payment_mode=random.choice(payment_modes),
-            date=date_offset,
-            user_id=user.id
-        )
-        expenses.append(expense)
-
-    db.session.add_all(expenses)
+
+
+def _get_or_create_user(index, password_hash):
+    email = seed_email(index)
+    user = User.query.filter_by(email=email).first()
+    if user:
+        return user, False
+    user = User(email=email, first_name='TestUser' if index == 0 else f'Seed{index}',
+                password=password_hash, gender='Male' if index % 2 else 'Female',
+                number=f'{1000000000 + index}')
+    db.session.add(user)
+    db.session.flush()
+    db.session.add_all(Account(name=name, number=f'{user.id:06d}-{n}', type=kind,
+                               balance=0.0, user_id=user.id)
+                       for n, (name, kind) in enumerate(ACCOUNTS))
     db.session.commit()
-    print(f"Added {len(expenses)} expenses.")
+    return user, True
+
+
+def seed(users=1, transactions=60, days=60, end_date=None, seed_value=0,
+         anomaly_rate=ANOMALY_RATE, batch_size=BATCH_SIZE, log=print):
+    """Create `users` seeded users with `transactions` rows each; returns rows inserted.
+
+    Users that already exist are left untouched, so re-running is safe.
+    Must run inside an app context.
+    """
+    end_date = end_date or date.today()
+    start = end_date - timedelta(days=days - 1)
+    # Hashing is deliberately slow; every seeded user shares one password.
+    password_hash = generate_password_hash(SEED_PASSWORD)
+    inserted = 0
+    seeded = []
+    started = time.perf_counter()
+    for index in range(users):
+        user, created = _get_or_create_user(index, password_hash)
+        if not created:
+            continue
+        account_ids = [a.id for a in Account.query.filter_by(user_id=user.id).order_by(Account.id)]
+        rng = np.random.default_rng([seed_value, index])
+        columns = generate_transactions(rng, transactions, start, days, account_ids, anomaly_rate)
+        _insert_columns(user.id, columns, batch_size)
+        seeded.append(user.id)
+        inserted += transactions
+        if log and (index + 1) % max(users // 10, 1) == 0:
+            rate = inserted / (time.perf_counter() - started)
+            log(f"  {index + 1}/{users} users, {inserted:,} rows ({rate:,.0f} rows/s)")
+
+    if seeded:
+        # Only the new users; existing ones are already up to date.
+        rollups.rebuild(seeded)
+        anomalies.rebuild(seeded)
+        anomalies.rebuild_breakdowns(seeded)
+        forecasts.rebuild(seeded)
+        forecasts.precompute(seeded)
+    return inserted
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=1)
+    parser.add_argument('--transactions', type=int, default=60, help='transactions per user')
+    parser.add_argument('--days', type=int, default=60, help='length of history in days')
+    parser.add_argument('--end-date', type=date.fromisoformat, default=None,
+                        help='last day of history, YYYY-MM-DD (default: today)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--anomaly-rate', type=float, default=ANOMALY_RATE)
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--database', help='SQLAlchemy URI (default: the app database)')
+    args = parser.parse_args()
+
+    config = {'SQLALCHEMY_DATABASE_URI': args.database} if args.database else None
+    app = create_app(config)
+    with app.app_context():
+        started = time.perf_counter()
+        inserted = seed(args.users, args.transactions, args.days, args.end_date, args.seed,
+                        args.anomaly_rate, args.batch_size)
+        elapsed = time.perf_counter() - started
+    print(f"Added {inserted:,} transactions for {args.users} user(s) in {elapsed:.1f}s "
+          f"(log in as {SEED_EMAIL} / {SEED_PASSWORD}).")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event
+from sqlalchemy.orm import load_only, make_transient_to_detached
+
+from __init__ import db
+
+# The profile fields templates and views read from current_user. The password
+# hash and data_version are left out: they are only read by code that queries
+# them itself, and on access they load like any expired attribute.
+CACHED_COLUMNS = ('id', 'email', 'first_name', 'gender', 'number')
+
+
+class UserCache:
+    """TTL-bounded LRU of user profile rows for the Flask-Login user loader.
+
+    Entries are plain column dicts, never ORM objects, so nothing is shared
+    between sessions or threads. A cached user is rebuilt as a detached
+    instance and merged into the request's session without a query. Profile
+    updates through the ORM invalidate the entry in this process; the TTL
+    bounds how stale other processes can be.
+    """
+
+    def __init__(self, max_entries=1024, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def init_app(self, app):
+        self.max_entries = app.config.get('USER_CACHE_SIZE', self.max_entries)
+        self.ttl = app.config.get('USER_CACHE_TTL', self.ttl)
+        app.extensions['user_cache'] = self
+
+    @property
+    def enabled(self):
+        return self.ttl > 0 and self.max_entries > 0
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                expires_at, values = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(user_id)
+                    self.hits += 1
+                    return values
+                del self._entries[user_id]
+            self.misses += 1
+            return None
+
+    def set(self, user_id, values):
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, values)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def load(self, user_id):
+        """Return the User for the loader, querying only on a cache miss."""
+        from models import User
+        if not self.enabled:
+            return db.session.get(User, user_id)
+
+        values = self.get(user_id)
+        if values is None:
+            user = db.session.get(User, user_id,
+                                  options=[load_only(*(getattr(User, c) for c in CACHED_COLUMNS))])
+            if user is not None:
+                self.set(user_id, {c: getattr(user, c) for c in CACHED_COLUMNS})
+            return user
+
+        user = User(**values)
+        make_transient_to_detached(user)
+        return db.session.merge(user, load=False)
+
+
+user_cache = UserCache()
+
+
+def _invalidate(mapper, connection, target):
+    user_cache.invalidate(target.id)
+
+
+def register_invalidation():
+    from models import User
+    if not event.contains(User, 'after_update', _invalidate):
+        event.listen(User, 'after_update', _invalidate)
+        event.listen(User, 'after_delete', _invalidate)
@@ -1,18 +1,40 @@
 import base64
+import hashlib
 import io
 import json
-from datetime import datetime
+import math
+from datetime import date, datetime
 
-from flask import Blueprint, Response, render_template, request, flash, jsonify, send_file, redirect, url_for
+from flask import Blueprint, Response, abort, render_template, request, flash, jsonify, send_file, redirect, stream_template, stream_with_context, url_for
 from flask_login import login_required, current_user
-from sqlalchemy import or_
+from sqlalchemy import func, or_
 
 from models import Note, Expense, Account
 from __init__ import db
-from ai_models import generate_all_charts, render_pie_chart, render_bar_chart, render_line_chart, get_expense_category_totals, get_income_category_totals, render_merged_bar_chart, render_merged_line_chart
+from database import read_only
+import anomalies
+import forecasts
+import pagination
+import rollups
+from chart_cache import chart_cache, bump_data_version, get_data_version
+from render_pool import render_pool
+from jobs import job_queue
+from ai_models import CHART_DATA_KINDS, CHART_KINDS, build_snapshot, chart_data, chart_render_jobs, forecast_version, generate_all_charts, render_chart, render_pie_chart, render_bar_chart, render_line_chart, get_expense_category_totals, render_merged_bar_chart, render_merged_line_chart
 
 views = Blueprint('views', __name__)
 
+RECENT_TRANSACTIONS = 10
+
+
+def _type_totals(*criteria):
+    """Return (total_income, total_expense) summed in SQL for rows matching criteria."""
+    rows = (db.session.query(Expense.type, func.coalesce(func.sum(Expense.amount), 0))
+            .filter(*criteria)
+            .group_by(Expense.type)
+            .all())
+    totals = dict(rows)
+    return float(totals.get('Income', 0)), float(totals.get('Expense', 0))
+
 
 @views.route('/profile')
 @login_required
@@ -28,46 +50,139 @@ def profile():
 
 @views.route('/charts')
 @login_required
+@read_only
 def charts():
+    # Images were rendered by the user's last analytics job (see jobs.py);
+    # one missing from the cache is rendered when the browser asks for it.
     chart_data = generate_all_charts(current_user.id)
     return render_template('charts.html', user=current_user, **chart_data)
 
 
+def prerender_charts(user_id):
+    """Render every uncached /charts image concurrently so the image requests hit the cache."""
+    version = get_data_version(user_id)
+    keys = {kind: _chart_cache_key(user_id, kind, _chart_version(user_id, kind, version))
+            for kind in CHART_KINDS}
+    missing = [kind for kind, key in keys.items() if chart_cache.get(key) is None]
+    if not missing:
+        return
+    rendered = render_pool.render_many(chart_render_jobs(user_id, missing, build_snapshot(user_id)))
+    for kind, png in rendered.items():
+        chart_cache.set(keys[kind], png)
+
+
+def _chart_version(user_id, kind, data_version):
+    """Version a chart image is cached under.
+
+    The forecast follows its fitted line rather than the data version, so it
+    is only redrawn when an expense actually moves the line.
+    """
+    if kind == 'forecast':
+        return forecast_version(user_id)
+    return data_version
+
+
+def _chart_cache_key(user_id, kind, version):
+    if kind in ('forecast', 'anomalies'):
+        # These windows end today, so the result also changes when the day
+        # rolls over. The date goes in the version, not the kind, so storing
+        # today's image deletes yesterday's from the disk cache.
+        version = f'{version}-{date.today().isoformat()}'
+    return (user_id, kind, version)
+
+
+def _conditional_response(key, build):
+    """Answer with a strong ETag derived from key (user, kind, data version).
+
+    A matching If-None-Match gets a 304 before build() is called; otherwise
+    build() produces the response, or None for a 404.
+    """
+    etag = hashlib.sha1(':'.join(str(part) for part in key).encode()).hexdigest()
+    if etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        response = build()
+        if response is None:
+            abort(404)
+    response.set_etag(etag)
+    # Cacheable by this browser only, and always revalidated against the ETag.
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+def _chart_response(kind, render):
+    """Serve a chart PNG from the chart cache, rendering only on a miss."""
+    version = _chart_version(current_user.id, kind, get_data_version(current_user.id))
+    key = _chart_cache_key(current_user.id, kind, version)
+
+    def build():
+        png = chart_cache.get_or_render(key, render)
+        if png is None:
+            return None
+        return send_file(io.BytesIO(png), mimetype='image/png', etag=False)
+
+    return _conditional_response(key, build)
+
+
+@views.route('/charts/<kind>.png')
+@login_required
+@read_only
+def chart_image(kind):
+    if kind not in CHART_KINDS:
+        abort(404)
+    return _chart_response(kind, lambda: render_chart(current_user.id, kind))
+
+
+@views.route('/api/charts/<kind>')
+@login_required
+@read_only
+def chart_data_api(kind):
+    """Chart inputs as JSON, for drawing /charts in the browser; PNG routes stay for exports."""
+    if kind not in CHART_DATA_KINDS:
+        abort(404)
+    version = _chart_version(current_user.id, kind, get_data_version(current_user.id))
+    key = _chart_cache_key(current_user.id, kind, version)
+    return _conditional_response(('json',) + key, lambda: jsonify(chart_data(current_user.id, kind)))
+
+
 @views.route('/expense_pie_chart')
 @login_required
 def expense_pie_chart():
-    totals = get_expense_category_totals(current_user.id)
-    return send_file(io.BytesIO(render_pie_chart(totals)), mimetype='image/png')
+    return _chart_response('expense_pie', lambda: render_pie_chart(
+        get_expense_category_totals(current_user.id)))
 
 
 @views.route('/expense_bar_chart')
 @login_required
 def expense_bar_chart():
-    totals = get_expense_category_totals(current_user.id)
-    return send_file(io.BytesIO(render_bar_chart(totals)), mimetype='image/png')
+    return _chart_response('expense_bar', lambda: render_bar_chart(
+        get_expense_category_totals(current_user.id)))
 
 
 @views.route('/expense_line_chart')
 @login_required
 def expense_line_chart():
-    totals = get_expense_category_totals(current_user.id)
-    return send_file(io.BytesIO(render_line_chart(totals)), mimetype='image/png')
+    return _chart_response('expense_line', lambda: render_line_chart(
+        get_expense_category_totals(current_user.id)))
 
 
 @views.route('/merged_bar_chart')
 @login_required
 def merged_bar_chart():
-    exp_totals = get_expense_category_totals(current_user.id)
-    inc_totals = get_income_category_totals(current_user.id)
-    return send_file(io.BytesIO(render_merged_bar_chart(exp_totals, inc_totals)), mimetype='image/png')
+    def render():
+        snapshot = build_snapshot(current_user.id)
+        return render_merged_bar_chart(snapshot['expense_totals'], snapshot['income_totals'])
+    return _chart_response('merged_bar_default', render)
 
 
 @views.route('/merged_line_chart')
 @login_required
 def merged_line_chart():
-    exp_totals = get_expense_category_totals(current_user.id)
-    inc_totals = get_income_category_totals(current_user.id)
-    return send_file(io.BytesIO(render_merged_line_chart(exp_totals, inc_totals)), mimetype='image/png')
+    def render():
+        snapshot = build_snapshot(current_user.id)
+        return render_merged_line_chart(snapshot['expense_totals'], snapshot['income_totals'])
+    return _chart_response('merged_line_default', render)
 
 
 
@@ -152,21 +267,18 @@ def account_history(account_id):
         return redirect(url_for('views.accounts'))
 
     # Primary match uses account id stored in payment_mode; name fallback keeps older data visible.
-    transactions = (Expense.query
-                    .filter(Expense.user_id == current_user.id)
-                    .filter(or_(Expense.payment_mode == str(account.id),
-                                Expense.payment_mode == account.name))
-                    .order_by(Expense.date.desc())
-                    .all())
+    account_match = or_(Expense.payment_mode == str(account.id),
+                        Expense.payment_mode == account.name)
+    query = Expense.query.filter(Expense.user_id == current_user.id).filter(account_match)
 
-    total_income = sum(t.amount for t in transactions if t.type == 'Income')
-    total_expense = sum(t.amount for t in transactions if t.type == 'Expense')
+    # The rollup is not keyed by account, so sum this account's rows in SQL.
+    total_income, total_expense = _type_totals(Expense.user_id == current_user.id, account_match)
 
-    return render_template(
+    return _render_listing(
         'account_history.html',
+        query,
         user=current_user,
         account=account,
-        transactions=transactions,
         total_income=total_income,
         total_expense=total_expense,
         net_balance=total_income - total_expense,
@@ -175,20 +287,81 @@ def account_history(account_id):
 
 @views.route('/reports')
 @login_required
+@read_only
 def reports():
-    transactions = Expense.query.filter_by(user_id=current_user.id).order_by(Expense.date.desc()).all()
-    total_income = sum(t.amount for t in transactions if t.type == 'Income')
-    total_expense = sum(t.amount for t in transactions if t.type == 'Expense')
-    return render_template(
+    query = Expense.query.filter_by(user_id=current_user.id)
+    total_income, total_expense = rollups.type_totals(current_user.id)
+    return _render_listing(
         'reports.html',
+        query,
         user=current_user,
-        transactions=transactions,
         total_income=total_income,
         total_expense=total_expense,
         total_balance=total_income - total_expense,
     )
 
 
+def _render_listing(template, query, **context):
+    """Render a transaction listing one keyset page at a time.
+
+    ?cursor= continues from a previous page. ?all=1 streams the full listing
+    instead, fetching rows in batches while the template renders, so memory
+    stays bounded and the first bytes go out before the last row is read.
+    """
+    if request.args.get('all'):
+        context.update(
+            transactions=pagination.iter_all(query),
+            has_transactions=query.with_entities(Expense.id).first() is not None,
+            next_cursor=None,
+            streaming=True,
+        )
+        return Response(stream_with_context(_buffered(stream_template(template, **context))))
+
+    try:
+        transactions, next_cursor = pagination.keyset_page(query, request.args.get('cursor'))
+    except ValueError:
+        abort(400)
+    return render_template(template, transactions=transactions, has_transactions=bool(transactions),
+                           next_cursor=next_cursor, streaming=False, **context)
+
+
+def _buffered(chunks, size=16 * 1024):
+    """Coalesce the many small fragments a streamed template yields into larger writes."""
+    buffer, buffered = [], 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        buffered += len(chunk)
+        if buffered >= size:
+            yield ''.join(buffer)
+            buffer, buffered = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+@views.route('/api/transactions', methods=['GET'])
+@login_required
+def transactions_api():
+    """Keyset-paginated transactions as JSON; pass next_cursor back as ?cursor=."""
+    query = Expense.query.filter(Expense.user_id == current_user.id)
+    account_id = request.args.get('account_id', type=int)
+    if account_id is not None:
+        account = Account.query.get(account_id)
+        if not account or account.user_id != current_user.id:
+            abort(404)
+        query = query.filter(or_(Expense.payment_mode == str(account.id),
+                                 Expense.payment_mode == account.name))
+    try:
+        transactions, next_cursor = pagination.keyset_page(
+            query, request.args.get('cursor'),
+            request.args.get('limit', pagination.PAGE_SIZE, type=int))
+    except ValueError:
+        abort(400)
+    return jsonify({
+        'transactions': [pagination.to_dict(t) for t in transactions],
+        'next_cursor': next_cursor,
+    })
+
+
 @views.route('/', methods=['GET'])
 def landing():
     return render_template("landingpage.html")
@@ -213,10 +386,14 @@ def home():
 @views.route('/dashboard', methods=['GET'])
 @login_required
 def dashboard():
-    expenses = Expense.query.filter_by(user_id=current_user.id).order_by(Expense.date.desc()).all()
+    # Only the most recent rows are shown, so never materialise the full history.
+    expenses = (Expense.query
+                .filter_by(user_id=current_user.id)
+                .order_by(Expense.date.desc(), Expense.id.desc())
+                .limit(RECENT_TRANSACTIONS)
+                .all())
     accounts = Account.query.filter_by(user_id=current_user.id).all()
-    total_income = sum(e.amount for e in expenses if e.type == 'Income')
-    total_expense = sum(e.amount for e in expenses if e.type == 'Expense')
+    total_income, total_expense = rollups.type_totals(current_user.id)
     total_balance = total_income - total_expense
 
     return render_template("dashboard.html",
@@ -230,6 +407,7 @@ def dashboard():
 
 @views.route('/api/accounts', methods=['GET'])
 @login_required
+@read_only
 def get_accounts():
     accounts = Account.query.filter_by(user_id=current_user.id).all()
     return jsonify([{
@@ -239,6 +417,25 @@ def get_accounts():
     } for account in accounts])
 
 
+def validate_expense_fields(amount, category, expense_type):
+    """Check a new transaction's required fields.
+
+    Returns (amount as float, None) when valid, otherwise (None, error message).
+    Shared by add_expense and the bulk importer so both accept the same rows.
+    """
+    if not amount or not category or not expense_type:
+        return None, 'Please fill in all required fields!'
+    try:
+        amount = float(amount)
+    except (TypeError, ValueError):
+        return None, 'Invalid amount!'
+    if not math.isfinite(amount):
+        return None, 'Invalid amount!'
+    if amount <= 0:
+        return None, 'Amount must be greater than 0!'
+    return amount, None
+
+
 @views.route('/add-expense', methods=['POST'])
 @login_required
 def add_expense():
@@ -249,17 +446,9 @@ def add_expense():
         payment_mode = request.form.get('paymentMode')
         description = request.form.get('description')
 
-        if not amount or not category or not expense_type:
-            flash('Please fill in all required fields!', category='error')
-            return jsonify({'success': False})
-
-        try:
-            amount = float(amount)
-            if amount <= 0:
-                flash('Amount must be greater than 0!', category='error')
-                return jsonify({'success': False})
-        except ValueError:
-            flash('Invalid amount!', category='error')
+        amount, error = validate_expense_fields(amount, category, expense_type)
+        if error:
+            flash(error, category='error')
             return jsonify({'success': False})
 
         new_expense = Expense(
@@ -272,9 +461,19 @@ def add_expense():
         )
 
         db.session.add(new_expense)
+        db.session.flush()
+        rollups.record_expense(new_expense)
+        anomaly = anomalies.record_expense(new_expense)
+        forecasts.record_expense(new_expense)
+        bump_data_version(current_user.id)
+        job_queue.enqueue(current_user.id)
         db.session.commit()
         flash('Expense added successfully!', category='success')
-        return jsonify({'success': True})
+        if anomaly:
+            flash(f"Unusual spending: Rs {anomaly['amount']:,.2f} on {anomaly['date']} is "
+                  f"{anomaly['z_score']:.1f} standard deviations above your typical day.",
+                  category='warning')
+        return jsonify({'success': True, 'anomaly': anomaly})
 
     except Exception as e:
         db.session.rollback()
@@ -289,7 +488,13 @@ def delete_expense(expense_id):
 
     if expense:
         if expense.user_id == current_user.id:
+            rollups.record_expense(expense, sign=-1)
+            bump_data_version(current_user.id)
             db.session.delete(expense)
+            db.session.flush()
+            anomalies.record_expense(expense, sign=-1)
+            forecasts.record_expense(expense, sign=-1)
+            job_queue.enqueue(current_user.id)
             db.session.commit()
             flash('Expense deleted!', category='error')
             return jsonify({'success': True})